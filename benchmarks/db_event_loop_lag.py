@@ -0,0 +1,117 @@
+"""Event loop lag under concurrent database load
+
+Simulates moderators spamming `/warning warnings` while a probe task measures how
+late the event loop wakes it up. Runs once with the queries made directly on the
+event loop (`get_session`) and once through the database thread (`get_async_session`).
+
+Usage (from the repository root, with the bot's environment configured):
+    python -m benchmarks.db_event_loop_lag [commands] [concurrency]
+"""
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+# Importing src creates the tables and runs the migrations, never against the real database
+_SCRATCH = tempfile.mkdtemp(prefix="eternal-benchmark-")
+os.environ["database_url"] = f"sqlite:///{os.path.join(_SCRATCH, 'benchmark.db')}"
+
+from sqlalchemy import desc, func  # noqa
+
+from src.database import get_async_session, get_session  # noqa
+from src.database.database import engine  # noqa
+from src.database.models.warning import WarningModel  # noqa
+
+PROBE_INTERVAL = 0.005
+MEMBERS = 200
+WARNINGS_PER_MEMBER = 50
+
+
+class _Member:
+    def __init__(self, id: int):
+        self.id = id
+
+
+def seed():
+    with get_session() as session:
+        session.add_all(
+            WarningModel(_Member(member), _Member(0), f"Benchmark warning {i}")
+            for member in range(MEMBERS)
+            for i in range(WARNINGS_PER_MEMBER)
+        )
+
+
+def query_warnings(session, member_id: int):
+    warnings = (
+        session.query(WarningModel)
+        .filter_by(memberId=member_id)
+        .order_by(desc(WarningModel.time))
+        .limit(50)
+        .all()
+    )
+    count = session.query(func.count(WarningModel.warningId)).filter_by(memberId=member_id).scalar()
+    return warnings, count
+
+
+async def sync_command(member_id: int):
+    with get_session() as session:
+        query_warnings(session, member_id)
+    await asyncio.sleep(0)
+
+
+async def async_command(member_id: int):
+    async with get_async_session() as session:
+        await session.run(query_warnings, member_id)
+
+
+async def probe(lags: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def run(command: Callable, commands: int, concurrency: int):
+    lags: List[float] = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(member_id: int):
+        async with semaphore:
+            await command(member_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(i % MEMBERS) for i in range(commands)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+
+    lags.sort()
+    print(
+        f"{command.__name__:>14}: {commands / elapsed:8.0f} commands/s | loop lag "
+        f"mean {statistics.mean(lags) * 1000:6.2f} ms, "
+        f"p99 {lags[int(len(lags) * 0.99)] * 1000:6.2f} ms, "
+        f"max {lags[-1] * 1000:6.2f} ms ({len(lags)} probes)"
+    )
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    try:
+        seed()
+        print(f"{commands} commands, {concurrency} concurrent, {MEMBERS * WARNINGS_PER_MEMBER} warnings")
+        asyncio.run(run(sync_command, commands, concurrency))
+        asyncio.run(run(async_command, commands, concurrency))
+    finally:
+        engine.dispose()
+        shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""WarningModel throughput across the SQLite profiles
+
+For every profile in `database_config.PROFILES` a fresh temporary database is created
+and timed for single row commits (what the automod used to do), batched inserts (what
+the write-behind queue does) and the `/warning warnings` queries.
+
+Usage (from the repository root, with the bot's environment configured):
+    python -m benchmarks.db_profiles [rows] [queries]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Importing src creates the tables and runs the migrations, never against the real database
+_SCRATCH = tempfile.mkdtemp(prefix="eternal-benchmark-")
+os.environ["database_url"] = f"sqlite:///{os.path.join(_SCRATCH, 'scratch.db')}"
+
+from sqlalchemy import desc, func  # noqa
+from sqlalchemy.orm import sessionmaker  # noqa
+
+from src.config.database_config import PROFILES  # noqa
+from src.database.database import Base, make_engine  # noqa
+from src.database.models.warning import WarningModel  # noqa
+
+MEMBERS = 100
+BATCH_SIZE = 100
+
+
+class _Member:
+    def __init__(self, id: int):
+        self.id = id
+
+
+def bench_profile(name: str, rows: int, queries: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'benchmark.db')}", PROFILES[name])
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        moderator = _Member(0)
+
+        start = time.perf_counter()
+        for i in range(rows):
+            with Session() as session:
+                session.add(WarningModel(_Member(i % MEMBERS), moderator, "Benchmark"))
+                session.commit()
+        single = rows / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(0, rows, BATCH_SIZE):
+            with Session() as session:
+                session.add_all(
+                    WarningModel(_Member(j % MEMBERS), moderator, "Benchmark")
+                    for j in range(i, min(i + BATCH_SIZE, rows))
+                )
+                session.commit()
+        batched = rows / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(queries):
+            with Session() as session:
+                session.query(WarningModel).filter_by(memberId=i % MEMBERS).order_by(
+                    desc(WarningModel.time)
+                ).limit(50).all()
+                session.query(func.count(WarningModel.warningId)).filter_by(memberId=i % MEMBERS).scalar()
+        queried = queries / (time.perf_counter() - start)
+
+        engine.dispose()
+    print(f"{name:>8}: {single:9.0f} rows/s single | {batched:9.0f} rows/s batched | {queried:7.0f} queries/s")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    print(f"{rows} rows, {queries} queries, batches of {BATCH_SIZE}")
+    try:
+        for name in PROFILES:
+            bench_profile(name, rows, queries)
+    finally:
+        shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Transcript markup compiler against the implementation it replaced
+
+`LegacyMarkup` is a copy of the old `Transcript.escape_html` path: `re.split` for the
+code blocks, `remove_ansi_sequences` compiling its regex on every call, and `populate`,
+whose emoji lookup re-slices and re-splits the rest of the message at every index.
+Both are timed over messages of growing length, the old one grows quadratically.
+
+Usage (from the repository root):
+    python -m benchmarks.transcript_markup [messages]
+"""
+import importlib.util
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import discord
+
+# Loaded by path, importing the `src` package would start loading the bot
+_spec = importlib.util.spec_from_file_location(
+    "transcript_markup", os.path.join(os.path.dirname(__file__), "..", "src", "transcripts", "markup.py")
+)
+markup = importlib.util.module_from_spec(_spec) # type: ignore
+_spec.loader.exec_module(markup) # type: ignore
+
+LENGTHS = (100, 500, 2000, 4000)
+SAMPLE = (
+    "Hello <@123456789012345678>, look at this <:pepe:123456789012345678> "
+    "and <a:dance:223456789012345678>!\n```py\nprint('\x1b[31mhi\x1b[0m')\n``` "
+    "more **text** & <stuff> @everyone\r\n"
+)
+
+
+class LegacyMarkup:
+    def remove_ansi_sequences(self, text: str) -> str:
+        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+        return ansi_escape.sub('', text)
+
+    def parse_emoji(self, emoji_id: str):
+        return f"https://cdn.discordapp.com/emojis/{emoji_id}.webp?size=128&quality=lossless"
+
+    def next_emoji_map(self, message: str, startIndex: int) -> Tuple[str, str]:
+        if startIndex != 0:
+            startIndex += 1
+        emoji_list = message[startIndex:].split("<")[1].split(">")[0]
+        emoji = emoji_list.split(":")[2]
+        sIdx = message.index(emoji, startIndex)
+        eIdx = sIdx + len(emoji)
+        emojiId = message[sIdx:eIdx]
+        original = "<:" + emoji_list.split(":")[1] + ":" + emojiId + ">"
+        return (original, emojiId)
+
+    def get_emoji_id_to_url_map(self, msg: str) -> Dict[str, str]:
+        msg = msg.replace(" ", "").replace("\r", "\n").replace("\n", "")
+        emoji = {}
+        for i in range(0, len(msg)):
+            try:
+                emoji_string, emoji_id = self.next_emoji_map(msg, i)
+                if emoji_string in list(emoji.keys()):
+                    continue
+                emoji[emoji_string] = self.parse_emoji(emoji_id)
+            except IndexError:
+                pass
+        return emoji
+
+    def url_map_to_html_map(self, url_map: Dict[str, str], width: int | str = 96, height: int | str = 96) -> Dict[str, str]:
+        return {k: f'<img class="emoji" src="{v}" width="{width}" height="{height}" />' for k, v in url_map.items()}
+
+    def populate(self, message: str) -> str:
+        id_to_img = self.url_map_to_html_map(self.get_emoji_id_to_url_map(message), 24, 24)
+        for k, v in id_to_img.items():
+            message = message.replace(k, v)
+        return message
+
+    def escape_html(self, text: str) -> str:
+        if not text:
+            return ""
+        out = []
+        for part in re.split(r'(```(?:[\s\S]*?)```)', text):
+            if part.startswith("```") and part.endswith("```"):
+                out.append(f'<pre>{self.remove_ansi_sequences(part[3:-3])}</pre>')
+                continue
+            part = self.remove_ansi_sequences(part)
+            part = discord.utils.escape_mentions(part)
+            part = part.replace("\r\n", "\n").replace("\r", "\n")
+            part = self.populate(part)
+            part = part.replace("\n", "<br>")
+            out.append(part)
+        return "".join(out)
+
+
+def message_of(length: int) -> str:
+    return (SAMPLE * (length // len(SAMPLE) + 1))[:length]
+
+
+def bench(render: Callable[[str], str], messages: List[str]) -> float:
+    start = time.perf_counter()
+    for message in messages:
+        render(message)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    legacy = LegacyMarkup()
+    print(f"{'length':>8} {'legacy':>14} {'compiler':>14} {'speedup':>9}")
+    for length in LENGTHS:
+        messages = [message_of(length)] * count
+        old = bench(legacy.escape_html, messages)
+        new = bench(markup.render_markup, messages)
+        print(f"{length:>8} {old:>11.1f} us {new:>11.1f} us {old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
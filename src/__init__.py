@@ -14,6 +14,7 @@ from .config.discord_config import BOT_PREFIX
 logger_config.configure_logger(
     [
         "Eternal.Main",
+        "Eternal.Administration",
         "Eternal.Database",
         "SQLAlchemy",
         "Discord",
@@ -27,6 +28,7 @@ logger_config.configure_logger(
 )
 
 from .database import get_session
+from .moderation.matcher import matcher_cache
 
 logger: logging.Logger = logging.getLogger("Eternal.Main")
 
@@ -77,6 +79,13 @@ asyncio.run(load_events(events))
 logger.debug("Extentions loaded!")
 
 
+async def setup_hook():
+    # Runs in the bot's event loop before it connects, get() must never build the matcher there
+    await matcher_cache.warm()
+
+bot.setup_hook = setup_hook # type: ignore
+
+
 @bot.event
 async def on_ready():
     # Sync commands once possible
@@ -1,23 +1,98 @@
+import asyncio
 import logging
-from typing import List
+import os
+import tempfile
+import textwrap
+from datetime import datetime
+from typing import List, Literal, Optional
 
 import discord
 from discord.ext import commands
-from sqlalchemy import desc, func
+from sqlalchemy import desc, or_
 
+from ..config import parse_duration, relative_dt
+from ..config.discord_config import GUILD
 from ..database.models.automod_words import AutomodWordsModel
 
-from ..database import get_session
+from ..database import get_async_session, moderation_writer, run_in_session
+from ..database.instrumentation import query_stats
+from ..database.counters import clear_member_warnings, rebuild_warning_summaries
+from ..database.models.ban import BanModel
 from ..database.models.warning import WarningModel
+from ..database.models.warning_summary import WarningSummaryModel
+from ..database.transfer import export_table, format_of, import_file, table_of
+from ..moderation.ban_expiry import ban_scheduler, lift_bans, record_ban
+from ..moderation.ban_mirror import BanMirror, list_bans
+from ..moderation.matcher import matcher_cache
+from ..moderation.pagination import KeysetPaginator
+from ..moderation.verdict_cache import verdict_cache
 
 from discord import app_commands
 
 logger: logging.Logger = logging.getLogger("Eternal.Administration")
 
+# Longest reason shown per ban in /ban list
+REASON_LENGTH = 200
+
+# Warnings shown per page of /warning warnings
+WARNINGS_PAGE_SIZE = 15
+
+
+def _list_warnings(session, member_id: int, after, limit: int) -> List[WarningModel]:
+    # Keyset pagination on (time, warningId), served by ix_warnings_member_time
+    query = session.query(WarningModel).filter(WarningModel.memberId == member_id)
+    if after is not None:
+        query = query.filter(
+            WarningModel.time <= after[0],
+            or_(WarningModel.time < after[0], WarningModel.warningId < after[1]),
+        )
+    return query.order_by(desc(WarningModel.time), desc(WarningModel.warningId)).limit(limit).all() # type: ignore
+
 
 class Administration(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.out_dir = os.path.join(os.path.dirname(__file__), 'out')
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.ban_mirror = BanMirror(os.path.join(self.out_dir, 'ban_mirror.json'))
+
+    async def cog_unload(self):
+        await ban_scheduler.stop()
+
+    async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CommandOnCooldown):
+            message = f"This command is on cooldown, try again in {error.retry_after:.0f} seconds."
+        elif isinstance(error, app_commands.CheckFailure):
+            message = "You don't have permission to use this command."
+        else:
+            return
+        logger.info(f"Refused /{interaction.command.qualified_name if interaction.command else '?'} for {interaction.user}: {error}")
+        if interaction.response.is_done():
+            await interaction.followup.send(message, ephemeral=True)
+        else:
+            await interaction.response.send_message(message, ephemeral=True)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        guild = self.bot.get_guild(GUILD)
+        if guild is None:
+            logger.warning("Guild %s not found, the ban scheduler and the ban mirror backfill don't run", GUILD)
+            return
+        # on_ready fires again after reconnects, the scheduler keeps running through those
+        if not ban_scheduler.running:
+            ban_scheduler.start(guild)
+        try:
+            await self.ban_mirror.backfill(guild)
+        except discord.HTTPException:
+            logger.exception("Failed backfilling the ban mirror")
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild: discord.Guild, user: discord.User):
+        await self.ban_mirror.on_ban(guild, user)
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild: discord.Guild, user: discord.User):
+        await self.ban_mirror.on_unban(guild, user)
 
     warning: app_commands.Group = app_commands.Group(
         name="warning", description="Manage user warnings and moderation"
@@ -41,33 +116,34 @@ class Administration(commands.Cog):
     @commands.cooldown(1, 2, commands.BucketType.member)
     async def warnings(self, interaction: discord.Interaction, member: discord.Member):
         logger.info(f"Fetching warnings for member {member} (ID: {member.id})")
-        warnings: List[WarningModel] = []
-        warnings_text: List[str] = ["none :)"]
-        with get_session() as session:
-            warnings = (
-                session.query(WarningModel)
-                .filter_by(memberId=member.id)
-                .order_by(desc(WarningModel.time)) # type: ignore
-                .limit(50)
-                .all()
-            )
-            warning_count = (
-                session.query(func.count(WarningModel.warningId))
-                .filter_by(memberId=member.id)
-                .scalar()
+        # Make sure automod warnings still sitting in the write-behind buffer show up
+        await moderation_writer.flush()
+        async with get_async_session() as session:
+            summary = await session.run(lambda session: session.get(WarningSummaryModel, member.id))
+        warning_count = summary.total if summary is not None else 0
+
+        async def fetch(after, limit: int) -> List[WarningModel]:
+            return await run_in_session(_list_warnings, member.id, after, limit)
+
+        def render(warnings: List[WarningModel], page: int, last: bool) -> discord.Embed:
+            warnings_text: List[str] = [
+                f"<t:{round(warning.time.timestamp())}> {warning.reason}" # type: ignore
+                for warning in warnings
+            ] or ["none :)"]
+            embed = discord.Embed(
+                title="Warnings",
+                description=f"{member.mention} has {warning_count} total warnings: \n- " + "\n- ".join(warnings_text),
+                color=discord.Color.orange(),
             )
-            if len(warnings) > 0:
-                warnings_text: List[str] = [
-                    f"<t:{round(warning.time.timestamp())}> {warning.reason}"
-                    for warning in warnings
-                ]
-        # TODO: If a member has way too many warnings, we might need to handle messages longer than 2000 chars by sending multiple messages.
-        # The terrible ternary will add "(showing at most 50 latest)" to the message if the user has more than 50 warnings
-        await interaction.response.send_message(
-            f"{member.mention} has {warning_count} total warnings{' (showing at most 50 latest)' if warning_count > 50 else ''}: \n- "
-            + "\n- ".join(warnings_text),
-            ephemeral=True,
+            pages = max(1, -(-warning_count // WARNINGS_PAGE_SIZE))
+            embed.set_footer(text=f"Page {page + 1} of {pages}")
+            return embed
+
+        view = KeysetPaginator(
+            fetch, lambda warning: (warning.time, warning.warningId), render, interaction.user.id,
+            page_size=WARNINGS_PAGE_SIZE,
         )
+        await view.start(interaction)
         logger.info(f"Displayed warnings for member {member} (ID: {member.id})")
         
         
@@ -80,13 +156,9 @@ class Administration(commands.Cog):
     @commands.cooldown(1, 2, commands.BucketType.member)
     async def clearwarnings(self, interaction: discord.Interaction, member: discord.Member): 
         logger.info(f"Clearing warnings for member {member} (ID: {member.id})")
-        with get_session() as session:
-            deleted_count = (
-                session.query(WarningModel)
-                .filter_by(memberId=member.id)
-                .delete(synchronize_session=False)
-            )
-            session.commit()
+        await moderation_writer.flush()
+        deleted_count = await run_in_session(clear_member_warnings, member.id)
+        self._reset_escalation(member.id)
         await interaction.response.send_message(
             f"Cleared {deleted_count} warnings for {member.mention}.",
             ephemeral=True,
@@ -94,6 +166,24 @@ class Administration(commands.Cog):
         logger.info(f"Cleared warnings for member {member} (ID: {member.id})")
     
     
+    @warning.command(
+        name="repaircounters",
+        description="Rebuilds the per-member warning counters from the warnings table",
+    )
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.checks.cooldown(1, 60, key=lambda i: i.guild_id)
+    async def repaircounters(self, interaction: discord.Interaction):
+        logger.info("Rebuilding warning counters")
+        await interaction.response.defer(ephemeral=True)
+        await moderation_writer.flush()
+        members = await run_in_session(rebuild_warning_summaries)
+        self._reset_escalation()
+        await interaction.followup.send(f"Rebuilt warning counters for {members} members.", ephemeral=True)
+        logger.info(f"Rebuilt warning counters for {members} members")
+    
+    
     @ban.command(
         name="member",
         description="Bans the specified member from the server.",
@@ -101,11 +191,24 @@ class Administration(commands.Cog):
     @commands.guild_only()
     @commands.has_permissions(ban_members=True)
     @commands.cooldown(1, 2, commands.BucketType.member)
+    @app_commands.describe(duration="How long the ban lasts, e.g. 30m, 12h or 7d. Permanent if left out.")
     async def banmember(self, interaction: discord.Interaction, member: discord.Member, *, reason: str
-        = "No reason provided"):
-        logger.info(f"Banning member {member} (ID: {member.id}) for reason: {reason}")
+        = "No reason provided", duration: Optional[str] = None):
+        expires = None
+        if duration is not None:
+            try:
+                expires = datetime.now() + parse_duration(duration)
+            except ValueError:
+                await interaction.response.send_message(f"Invalid duration `{duration}`, use something like 30m, 12h or 7d.", ephemeral=True)
+                return
+        logger.info(f"Banning member {member} (ID: {member.id}) for reason: {reason}" + (f" until {expires}" if expires else ""))
         await member.ban(reason=reason)
-        await interaction.response.send_message(f"{member.mention} has been banned. Reason: {reason}", ephemeral=True)
+        ban_id = await run_in_session(record_ban, BanModel(member, interaction.user, reason, expires)) # type: ignore
+        if expires is not None:
+            ban_scheduler.schedule(ban_id, member.id, expires)
+            await interaction.response.send_message(f"{member.mention} has been banned, the ban expires {relative_dt(expires)}. Reason: {reason}", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"{member.mention} has been banned. Reason: {reason}", ephemeral=True)
         logger.info(f"Banned member {member} (ID: {member.id})")
     
     
@@ -120,6 +223,8 @@ class Administration(commands.Cog):
         logger.info(f"Unbanning user with ID: {user_id}")
         user = await self.bot.fetch_user(user_id)
         await interaction.guild.unban(user)
+        # Keep the ban scheduler from lifting it a second time
+        await run_in_session(lift_bans, user_id)
         await interaction.response.send_message(f"{user.mention} has been unbanned.", ephemeral=True)
         logger.info(f"Unbanned user with ID: {user_id}")
         
@@ -133,14 +238,27 @@ class Administration(commands.Cog):
     @commands.cooldown(1, 2, commands.BucketType.member)
     async def listbans(self, interaction: discord.Interaction):
         logger.info("Fetching list of banned users...")
-        bans = await interaction.guild.bans()
-        if not bans:
-            await interaction.response.send_message("There are no banned users in this server.", ephemeral=True)
-            logger.info("No banned users found.")
-            return
+        guild_id = interaction.guild.id
 
-        ban_list = "\n".join([f"{ban.user} (ID: {ban.user.id}) - Reason: {ban.reason or 'No reason provided'}" for ban in bans])
-        await interaction.response.send_message(f"Banned users:\n{ban_list}", ephemeral=True)
+        async def fetch(after, limit: int) -> List[BanModel]:
+            return await run_in_session(list_bans, guild_id, after, limit)
+
+        def render(bans: List[BanModel], page: int, last: bool) -> discord.Embed:
+            embed = discord.Embed(title="Banned users", color=discord.Color.red())
+            if not bans:
+                embed.description = "There are no banned users in this server." if page == 0 else "No more banned users."
+            else:
+                embed.description = "\n".join(
+                    # Audit log reasons run up to 512 characters, ten of them could overflow the embed
+                    f"<@{ban.memberId}> (ID: {ban.memberId}) - Reason: {textwrap.shorten(str(ban.reason), REASON_LENGTH)}"
+                    + (f" - expires {relative_dt(ban.expires)}" if ban.expires else "") # type: ignore
+                    for ban in bans
+                )
+            embed.set_footer(text=f"Page {page + 1}")
+            return embed
+
+        view = KeysetPaginator(fetch, lambda ban: (ban.time, ban.banId), render, interaction.user.id)
+        await view.start(interaction)
         logger.info("Displayed list of banned users.")
         
         
@@ -153,11 +271,11 @@ class Administration(commands.Cog):
     @commands.cooldown(1, 2, commands.BucketType.member)
     async def addbannedword(self, interaction: discord.Interaction, word: str):
         logger.info(f"Adding banned word: {word}")
-        with get_session() as session:
-            new_word = AutomodWordsModel(word)
-            session.add(new_word)
-            session.commit()
-        await interaction.response.send_message(f"The word '{word}' has been added to the banned words list.", ephemeral=True)
+        async with get_async_session() as session:
+            await session.run(lambda session: session.add(AutomodWordsModel(word)))
+        await matcher_cache.reload_async()
+        self._sweep_nicknames()
+        await interaction.response.send_message(f"The word '{word}' has been added to the banned words list. Existing nicknames are being re-checked.", ephemeral=True)
         logger.info(f"Added banned word: {word}")
         
         
@@ -170,14 +288,14 @@ class Administration(commands.Cog):
     @commands.cooldown(1, 2, commands.BucketType.member)
     async def removebannedword(self, interaction: discord.Interaction, word: str):
         logger.info(f"Removing banned word: {word}")
-        with get_session() as session:
-            deleted_count = (
-                session.query(AutomodWordsModel)
+        async with get_async_session() as session:
+            deleted_count = await session.run(
+                lambda session: session.query(AutomodWordsModel)
                 .filter_by(word=word)
                 .delete(synchronize_session=False)
             )
-            session.commit()
         if deleted_count > 0:
+            await matcher_cache.reload_async()
             await interaction.response.send_message(f"The word '{word}' has been removed from the banned words list.", ephemeral=True)
             logger.info(f"Removed banned word: {word}")
         else:
@@ -185,6 +303,141 @@ class Administration(commands.Cog):
             logger.info(f"Banned word not found: {word}")
     
     
+    @moderation.command(
+        name="reload",
+        description="Rebuilds the automod matcher from the banned words list.",
+    )
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_messages=True)
+    @app_commands.checks.has_permissions(manage_messages=True)
+    @app_commands.checks.cooldown(1, 30, key=lambda i: i.guild_id)
+    async def reloadbannedwords(self, interaction: discord.Interaction):
+        logger.info("Reloading automod matcher")
+        matcher = await matcher_cache.reload_async()
+        await interaction.response.send_message(f"Automod matcher reloaded with {len(matcher.words)} words (version {matcher.version}).", ephemeral=True)
+        logger.info(f"Reloaded automod matcher (version {matcher.version})")
+        
+        
+    @moderation.command(
+        name="stats",
+        description="Shows automod and moderation database statistics.",
+    )
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_messages=True)
+    @app_commands.checks.has_permissions(manage_messages=True)
+    @app_commands.checks.cooldown(1, 2)
+    async def moderationstats(self, interaction: discord.Interaction):
+        matcher = matcher_cache.get()
+        verdicts = verdict_cache.stats()
+        writer = moderation_writer.stats()
+        embed = discord.Embed(title="Moderation statistics", color=discord.Color.blurple())
+        embed.add_field(
+            name="Automod matcher",
+            value=f"Version {matcher.version}\n{len(matcher.words)} words",
+        )
+        embed.add_field(
+            name="Verdict cache",
+            value=(
+                f"{verdicts['size']} entries\n"
+                f"{verdicts['hits']} hits, {verdicts['misses']} misses ({verdicts['hit_rate']:.0%})"
+            ),
+        )
+        embed.add_field(
+            name="Write-behind queue",
+            value=(
+                f"{writer['depth']} pending rows\n"
+                f"{writer['flushed_rows']} rows in {writer['flush_count']} flushes\n"
+                f"Last flush {writer['last_flush_latency_ms']:.1f} ms, max {writer['max_flush_latency_ms']:.1f} ms"
+            ),
+        )
+        sql = query_stats.stats()
+        statements = sql["statements"]
+        sessions = sql["sessions"]
+        embed.add_field(
+            name="SQL",
+            value=(
+                f"{statements['count']} statements ({sql['distinct']} distinct)\n"
+                f"p50 {statements['p50_ms']:.1f} ms, p95 {statements['p95_ms']:.1f} ms, max {statements['max_ms']:.1f} ms\n"
+                f"Sessions p95 {sessions['p95_ms']:.1f} ms, max {sessions['max_ms']:.1f} ms\n"
+                f"{sql['slow']} slow (over {sql['slow_threshold_ms']:.0f} ms)"
+            ),
+        )
+        top = query_stats.top(3)
+        if top:
+            embed.add_field(
+                name="Most time spent in",
+                value="\n".join(
+                    f"`{statement[:80]}` {histogram['count']}x, {histogram['mean_ms']:.2f} ms avg"
+                    for statement, histogram in top
+                ),
+                inline=False,
+            )
+        automod = self.bot.get_cog("AutoModeration")
+        if automod is not None:
+            flood = automod.flood.stats() # type: ignore
+            embed.add_field(
+                name="Flood detector",
+                value=(
+                    f"Tracking {flood['members']} members, {flood['channels']} channels\n"
+                    f"{flood['member_trips']} member floods, {flood['channel_trips']} channel floods"
+                ),
+            )
+            sweep = automod.sweep.stats() # type: ignore
+            embed.add_field(
+                name="Nickname sweep",
+                value=(
+                    f"{'Running' if sweep['running'] else 'Idle'}\n"
+                    f"{sweep['scanned']} scanned, {sweep['renamed']} renamed\n"
+                    f"{sweep['rate']:.0f} members/s"
+                ),
+            )
+            escalation = automod.escalation.stats() # type: ignore
+            embed.add_field(
+                name="Escalation",
+                value=f"{escalation['actions']} actions\nTracking {escalation['tracked']} members",
+            )
+            joins = automod.joins.stats() # type: ignore
+            embed.add_field(
+                name="Joins",
+                value=(
+                    f"{joins['queued']} queued, {joins['processed']} processed\n"
+                    f"Raid mode {'on' if joins['raid_mode'] else 'off'}, {joins['deferred']} nickname checks deferred"
+                ),
+            )
+            bursts = automod.bursts.stats() # type: ignore
+            embed.add_field(
+                name="Burst mode",
+                value=(
+                    f"{bursts['bursting']} channels bursting\n"
+                    f"{bursts['coalesced']} violations in {bursts['flushes']} bulk deletes"
+                ),
+            )
+            embed.add_field(
+                name="Edits",
+                value=f"{automod.edits_scanned} re-scanned\n{automod.edits_skipped} unchanged", # type: ignore
+            )
+        bans = ban_scheduler.stats()
+        embed.add_field(
+            name="Temporary bans",
+            value=(
+                f"{'Running' if bans['running'] else 'Stopped'}, {bans['queued']} upcoming expiries loaded\n"
+                f"{bans['lifted']} lifted in {bans['batches']} batches"
+            ),
+        )
+        transcripts = self.bot.get_cog("Transcript")
+        if transcripts is not None:
+            jobs = transcripts.jobs.stats() # type: ignore
+            embed.add_field(
+                name="Transcripts",
+                value=(
+                    f"{jobs['running']} running, {jobs['queued']} queued\n"
+                    f"{jobs['completed']} done, {jobs['failed']} failed, {jobs['cancelled']} cancelled\n"
+                    f"{jobs['avg_duration']:.1f} s average, {jobs['max_duration']:.1f} s longest"
+                ),
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        
+        
     @moderation.command(
         name="purge",
         description="Purge x ammount of messages from a channel.",
@@ -199,6 +452,84 @@ class Administration(commands.Cog):
         logger.info(f"Purged {len(deleted)} messages from channel {interaction.channel} (ID: {interaction.channel.id})")
         
     
+    @moderation.command(
+        name="export",
+        description="Exports a moderation table as a JSON Lines or CSV file.",
+    )
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.checks.cooldown(1, 30, key=lambda i: i.guild_id)
+    async def exporttable(self, interaction: discord.Interaction, table: Literal["warnings", "bans", "automod_words"],
+        format: Literal["jsonl", "csv"] = "jsonl"):
+        logger.info(f"Exporting table {table} as {format}")
+        await interaction.response.defer(ephemeral=True)
+        # Rows still waiting in the write-behind buffer belong in the export
+        await moderation_writer.flush()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"{table}.{format}")
+            # Streams on its own thread and connection, the database thread stays free
+            report = await asyncio.to_thread(export_table, table, path, format)
+            if os.path.getsize(path) > interaction.guild.filesize_limit:
+                await interaction.followup.send(f"The export is too large to upload, use `python -m src.database.export` on the server instead. {report.describe()}", ephemeral=True)
+                return
+            await interaction.followup.send(report.describe(), file=discord.File(path), ephemeral=True)
+        logger.info(f"Exported {report.describe()}")
+    
+    
+    @moderation.command(
+        name="import",
+        description="Imports a file created by /moderation export.",
+    )
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.checks.cooldown(1, 30, key=lambda i: i.guild_id)
+    @app_commands.describe(table="The table the file was exported from, read from the file name if left out.")
+    async def importtable(self, interaction: discord.Interaction, file: discord.Attachment,
+        table: Optional[Literal["warnings", "bans", "automod_words"]] = None):
+        logger.info(f"Importing {file.filename}")
+        try:
+            table = table or table_of(file.filename)
+            format_of(file.filename)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, os.path.basename(file.filename))
+            await file.save(path) # type: ignore
+            try:
+                report = await asyncio.to_thread(import_file, path, table)
+            except (ValueError, KeyError) as e:
+                await interaction.followup.send(f"Import failed, the file doesn't look like a {table} export: {e}", ephemeral=True)
+                return
+        if table == "automod_words":
+            await matcher_cache.reload_async()
+        elif table == "warnings":
+            self._reset_escalation()
+        elif table == "bans" and ban_scheduler.running:
+            # Pick up the expiries of the imported bans
+            ban_scheduler.start(interaction.guild)
+        await interaction.followup.send(report.describe(), ephemeral=True)
+        logger.info(f"Imported {report.describe()}")
+        
+    
+    def _sweep_nicknames(self):
+        automod = self.bot.get_cog("AutoModeration")
+        if automod is not None:
+            automod.start_nickname_sweep() # type: ignore
+
+    def _reset_escalation(self, member_id: Optional[int] = None):
+        # The escalation engine keeps recent warnings in memory, they must not outlive the rows
+        automod = self.bot.get_cog("AutoModeration")
+        if automod is None:
+            return
+        if member_id is None:
+            automod.escalation.reset() # type: ignore
+        else:
+            automod.escalation.invalidate(member_id) # type: ignore
+        
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Administration(bot))
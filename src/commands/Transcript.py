@@ -1,10 +1,12 @@
-import re
-import requests
-from typing import Tuple, List, Dict
 import discord
 from discord.ext import commands
 import os
-from ..config.transcript_config import createHeader
+from typing import Awaitable, Callable, List, Optional, Union
+from ..transcripts.checkpoint import write_incremental_transcript
+from ..transcripts.jobs import TranscriptJob, TranscriptJobQueue
+from ..transcripts.markup import render_markup
+from ..transcripts.threads import export_threads
+from ..transcripts.writer import MESSAGE_TEMPLATE, TranscriptReport, transcript_filename, write_transcript
 from logging import Logger, getLogger
 from discord import app_commands
 
@@ -18,142 +20,22 @@ class Transcript(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.out_dir = os.path.join(os.path.dirname(__file__), 'out')            
+        self.out_dir = os.path.join(os.path.dirname(__file__), 'out')
+        os.makedirs(self.out_dir, exist_ok=True)
+        # Incremental transcripts, one directory per channel
+        self.checkpoint_dir = os.path.join(self.out_dir, 'checkpoints')
+        self.jobs = TranscriptJobQueue(self.out_dir)
 
+    async def cog_unload(self):
+        await self.jobs.close()
 
-    def remove_ansi_sequences(self, text: str) -> str:
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        return ansi_escape.sub('', text)
 
-    
-    def parse_emoji(self, emoji_id: str):
-        return f"https://cdn.discordapp.com/emojis/{emoji_id}.webp?size=128&quality=lossless"
-
-
-    def next_emoji(self,message: str, startIndex: int) -> Tuple[int, int]:
-        """
-        Returns:
-            - start and end index of the nearest emoji ID
-        Raises: 
-            - IndexError if invalid tag.
-        """
-        if startIndex != 0:
-            startIndex += 1
-        emoji = message[startIndex:].split("<")[1].split(">")[0].split(":")[2]
-        sIdx = message.index(emoji, startIndex)
-        eIdx = sIdx + len(emoji)
-        return (sIdx, eIdx)
-
-
-    def next_emoji_map(self, message: str, startIndex: int) -> Tuple[str, str]:
+    def escape_html(self, text: str) -> str:
         """
-        Returns:
-            - start and end index of the nearest emoji ID
-        Raises:
-            - IndexError if invalid tag.
+        Keep code blocks as <pre>, escape mentions and HTML, preserve newlines,
+        and inject custom emoji <img> tags, see `transcripts.markup`.
         """
-        if startIndex != 0:
-            startIndex += 1
-        emoji_list = message[startIndex:].split("<")[1].split(">")[0]
-        emoji = emoji_list.split(":")[2]
-        sIdx = message.index(emoji, startIndex)
-        eIdx = sIdx + len(emoji)
-        emojiId = message[sIdx:eIdx]
-        original = "<:" + emoji_list.split(":")[1] + ":" + emojiId + ">"
-        return (original, emojiId)
-
-
-    def get_all_emoji_urls(self, msg: str) -> List[str]:
-        msg = msg.replace(" ", "").replace("\r", "\n").replace("\n", "")
-
-        emoji = []
-
-        for i in range(0, len(msg)):
-            try:
-                idx = self.next_emoji(msg, i)
-                emoji_id = msg[idx[0]:idx[1]]
-                if emoji_id in emoji:
-                    continue
-                emoji.append(emoji_id)
-            except IndexError:
-                pass
-
-        return emoji
-
-
-    def get_emoji_id_to_url_map(self, msg: str) -> Dict[str, str]:
-        msg = msg.replace(" ", "").replace("\r", "\n").replace("\n", "")
-
-        emoji = {}
-
-        for i in range(0, len(msg)):
-            try:
-                emoji_string, emoji_id = self.next_emoji_map(msg, i)
-                if emoji_string in list(emoji.keys()):
-                    continue
-                emoji_url = self.parse_emoji(emoji_id)
-                emoji[emoji_string] = emoji_url
-            except IndexError:
-                pass
-
-        return emoji
-
-
-    def url_map_to_html_map(self, url_map: Dict[str, str], width: int | str = 96, height: int | str = 96) -> Dict[str, str]:
-        return {k: f'<img class="emoji" src="{v}" width="{width}" height="{height}" />' for k, v in url_map.items()}
-
-
-    def download_all(self, emoji_urls: List[str], path: str):
-        for e in emoji_urls:
-            url = self.parse_emoji(e)
-            res = requests.get(url)
-            with open(f"{path}/{e}.webp", "wb") as f:
-                f.write(res.content)
-
-
-    def populate(self, message: str) -> str:
-        id_to_url = self.get_emoji_id_to_url_map(message)
-
-        id_to_img = self.url_map_to_html_map(id_to_url, 24, 24)
-
-        for k, v in id_to_img.items():
-            message = message.replace(k, v)
-
-        return message
-        
-        
-    def escape_html(self, text: str) -> str:
-            """
-            Keep code blocks as <pre>, escape mentions/markdown, preserve newlines,
-            and inject custom emoji <img> tags.
-            """
-            
-            def format_code_block(code: str) -> str:
-                clean_code = self.remove_ansi_sequences(code)
-                return f'<pre>{clean_code}</pre>'
-
-            if not text:
-                return ""
-
-            parts = re.split(r'(```(?:[\s\S]*?)```)', text)
-            out = []
-
-            for part in parts:
-                if part.startswith("```") and part.endswith("```"):
-                    out.append(format_code_block(part[3:-3]))
-                    continue
-
-                # Normal text
-                part = self.remove_ansi_sequences(part)
-                part = discord.utils.escape_mentions(part)  # avoid pinging
-                # Keep it simple: don't try to re-implement markdown; just preserve lines.
-                part = part.replace("\r\n", "\n").replace("\r", "\n")
-                part = self.populate(part)  # convert <:custom:123> to <img ...>
-                part = part.replace("\n", "<br>")
-
-                out.append(part)
-
-            return "".join(out)
+        return render_markup(text)
 
 
     def escape_attachments(self, attachments):
@@ -208,60 +90,68 @@ class Transcript(commands.Cog):
         return f'#{getattr(color, "value", 0):06x}'
 
                 
+    def render_message(self, message: discord.Message) -> str:
+        return MESSAGE_TEMPLATE.format(
+            pfp=str(message.author.display_avatar.url),
+            color=self._color_hex(message.author.color),
+            author_name=message.author.display_name,
+            content=self.escape_html(message.content or ""),
+            attachments=self.escape_attachments(message.attachments),
+        )
+
+                
+    async def _submit(
+        self,
+        interaction: discord.Interaction,
+        kind: str,
+        target: Union[discord.abc.GuildChannel, discord.Thread],
+        label: str,
+        run: Callable[[TranscriptJob], Awaitable[List[TranscriptReport]]],
+    ):
+        """Queues a transcript job, the files are sent to the user's DMs once it's done."""
+        job = TranscriptJob(interaction.guild_id, kind, target.id, label, interaction.user, run) # type: ignore
+        queued = self.jobs.submit(job)
+        if queued is not job:
+            await interaction.response.send_message(
+                f"{label} is already being exported as job #{queued.id}, you'll get the transcript as well.",
+                ephemeral=True,
+            )
+            return
+
+        # Answer first, a slow DM must not miss the interaction deadline
+        await interaction.response.send_message(
+            f"Queued as job #{job.id}, progress and the transcript will be in your DMs.", ephemeral=True
+        )
+        try:
+            job.status_message = await interaction.user.send(job.describe())
+        except discord.HTTPException:
+            cancelled = self.jobs.unsubscribe(job, interaction.user)
+            note = f"Cancelled job #{job.id}" if cancelled else f"Job #{job.id} keeps running for the others who asked"
+            await interaction.followup.send(
+                f"I cannot DM you, so I can't send you the transcript. {note}. Please enable direct messages.",
+                ephemeral=True,
+            )
+
+
     @transcript.command(
     name="channel",
     description="creates transcript for a channel",
     )
-    async def transcriptchannel(self, interaction: discord.Interaction, channel: discord.TextChannel):
-
-        await interaction.response.defer(ephemeral=True)
-
-        filename = f"{channel.name}.html"
-        filepath = os.path.join(self.out_dir, filename)
-
-        with open(filepath, "w", encoding="utf-8") as file:
-            file.write(await createHeader(channel.name))
-
-            messages = []
-            async for message in channel.history(limit=None):
-                content = self.escape_html(message.content or "")
-                attachments = self.escape_attachments(message.attachments)
-                pfp_url = str(message.author.display_avatar.url)
-                color_hex = self._color_hex(message.author.color)
-                author_name = message.author.display_name
-                messages.append((pfp_url, color_hex, author_name, content, attachments))
-
-            for pfp, color, author_name, content, attachments in reversed(messages):
-                file.write(
-                    f'''
-                    <div class="message">
-                        <img class="avatar" src="{pfp}" alt="{author_name} avatar">
-                        <div class="content">
-                            <div class="header">
-                                <span class="username" style="color:{color}">{author_name}</span>
-                            </div>
-                            <div class="message-body">{content}</div>
-                            {attachments}
-                        </div>
-                    </div>
-                    '''
-                )
-
-            file.write("</main></body></html>")
-
-        # Send the transcript via DM
-        try:
-            await interaction.user.send(file=discord.File(filepath))
-        except discord.Forbidden:
-            await interaction.followup.send("I cannot DM you. Please enable direct messages.", ephemeral=True)
-        else:
-            await interaction.followup.send("Transcript sent to your DMs!", ephemeral=True)
-
-        # Delete file locally
-        try:
-            os.remove(filepath)
-        except Exception:
-            pass
+    @app_commands.describe(incremental="Only fetch messages newer than the last incremental transcript")
+    async def transcriptchannel(self, interaction: discord.Interaction, channel: discord.TextChannel, incremental: bool = False):
+
+        async def run(job: TranscriptJob) -> List[TranscriptReport]:
+            path = os.path.join(job.out_dir, transcript_filename(channel))
+            if incremental:
+                return [await write_incremental_transcript(
+                    channel, os.path.join(self.checkpoint_dir, str(channel.id)), path, channel.name,
+                    self.render_message, progress=job.advance,
+                )]
+            return [await write_transcript(channel, path, channel.name, self.render_message, progress=job.advance)]
+
+        # Both kinds can run side by side, only one export at a time may use the checkpoint
+        kind = "incremental" if incremental else "channel"
+        await self._submit(interaction, kind, channel, f"#{channel.name}", run)
 
     @transcript.command(
     name="thread", 
@@ -269,55 +159,15 @@ class Transcript(commands.Cog):
     )
     async def transcriptthread(self, interaction: discord.Interaction, thread: discord.Thread):
 
-        await interaction.response.defer(ephemeral=True)
-
-        filename = f"{thread.name}.html"
-        filepath = os.path.join(self.out_dir, filename)
-
-        with open(filepath, "w", encoding="utf-8") as file:
-            file.write(await createHeader(thread.name))
-            file.write(f"<div>Thread ID: {thread.id}, Name: {thread.name}</div>")
-
-            messages = []
-            async for message in thread.history(limit=None):
-                content = self.escape_html(message.content or "")
-                attachments = self.escape_attachments(message.attachments)
-                pfp_url = str(message.author.display_avatar.url)
-                color_hex = self._color_hex(message.author.color)
-                author_name = message.author.display_name
-                messages.append((pfp_url, color_hex, author_name, content, attachments))
-
-            for pfp, color, author_name, content, attachments in reversed(messages):
-                file.write(
-                    f'''
-                    <div class="message">
-                        <img class="avatar" src="{pfp}" alt="{author_name} avatar">
-                        <div class="content">
-                            <div class="header">
-                                <span class="username" style="color:{color}">{author_name}</span>
-                            </div>
-                            <div class="message-body">{content}</div>
-                            {attachments}
-                        </div>
-                    </div>
-                    '''
-                )
+        async def run(job: TranscriptJob) -> List[TranscriptReport]:
+            path = os.path.join(job.out_dir, transcript_filename(thread))
+            return [await write_transcript(
+                thread, path, thread.name, self.render_message,
+                intro=f"<div>Thread ID: {thread.id}, Name: {thread.name}</div>",
+                progress=job.advance,
+            )]
 
-            file.write("</main></body></html>")
-
-        # DM user
-        try:
-            await interaction.user.send(file=discord.File(filepath))
-        except discord.Forbidden:
-            await interaction.followup.send("I cannot DM you. Please enable direct messages.", ephemeral=True)
-        else:
-            await interaction.followup.send("Transcript sent to your DMs!", ephemeral=True)
-
-        # Delete local file
-        try:
-            os.remove(filepath)
-        except Exception:
-            pass
+        await self._submit(interaction, "thread", thread, f"thread {thread.name}", run)
 
         
             
@@ -325,65 +175,40 @@ class Transcript(commands.Cog):
     name="threads",
     description="creates transcripts for all threads in the channel",
     )
-    async def transcriptthreads(self, interaction: discord.Interaction, channel: discord.TextChannel):
-
-        await interaction.response.defer(ephemeral=True)
-
-        threads = channel.archived_threads()
-        sent_files = []
-
-        async for thread in threads:
-            filename = f"{thread.name}.html"
-            filepath = os.path.join(self.out_dir, filename)
-
-            with open(filepath, "w", encoding="utf-8") as file:
-                file.write(await createHeader(thread.name))
-                file.write(f"<div>Thread ID: {thread.id}, Name: {thread.name}</div>")
-
-                messages = []
-                async for message in thread.history(limit=None):
-                    content = self.escape_html(message.content or "")
-                    attachments = self.escape_attachments(message.attachments)
-                    pfp_url = str(message.author.display_avatar.url)
-                    color_hex = self._color_hex(message.author.color)
-                    author_name = message.author.display_name
-                    messages.append((pfp_url, color_hex, author_name, content, attachments))
-
-                for pfp, color, author_name, content, attachments in reversed(messages):
-                    file.write(
-                        f'''
-                        <div class="message">
-                            <img class="avatar" src="{pfp}" alt="{author_name} avatar">
-                            <div class="content">
-                                <div class="header">
-                                    <span class="username" style="color:{color}">{author_name}</span>
-                                </div>
-                                <div class="message-body">{content}</div>
-                                {attachments}
-                            </div>
-                        </div>
-                        '''
-                    )
-
-                file.write("</main></body></html>")
-
-            sent_files.append(filepath)
-
-        # DM each transcript
-        try:
-            for fp in sent_files:
-                await interaction.user.send(file=discord.File(fp))
-        except discord.Forbidden:
-            await interaction.followup.send("I cannot DM you. Please enable direct messages.", ephemeral=True)
-        else:
-            await interaction.followup.send("All thread transcripts sent to your DMs!", ephemeral=True)
+    async def transcriptthreads(self, interaction: discord.Interaction, channel: Union[discord.TextChannel, discord.ForumChannel]):
 
-        # Delete all local files
-        for fp in sent_files:
-            try:
-                os.remove(fp)
-            except Exception:
-                pass
+        async def run(job: TranscriptJob) -> List[TranscriptReport]:
+            return await export_threads(channel, job.out_dir, self.render_message, progress=job.advance)
+
+        await self._submit(interaction, "threads", channel, f"the threads of #{channel.name}", run)
+
+
+    @transcript.command(
+    name="cancel",
+    description="cancels a transcript job, your latest one if no job is given",
+    )
+    async def transcriptcancel(self, interaction: discord.Interaction, job: Optional[int] = None):
+
+        if job is not None:
+            target = self.jobs.get(job)
+            if target is not None and target.guild_id != interaction.guild_id:
+                target = None
+        else:
+            own = [queued for queued in self.jobs.jobs(interaction.guild_id) if queued.requester.id == interaction.user.id] # type: ignore
+            target = own[-1] if own else None
+        if target is None:
+            await interaction.response.send_message("There is no such transcript job queued or running.", ephemeral=True)
+            return
+
+        permissions = getattr(interaction.user, "guild_permissions", None)
+        if target.requester.id != interaction.user.id and not (permissions and permissions.manage_messages):
+            await interaction.response.send_message("You can only cancel your own transcript jobs.", ephemeral=True)
+            return
+
+        if self.jobs.cancel(target):
+            await interaction.response.send_message(f"Cancelled transcript job #{target.id}.", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"Transcript job #{target.id} already {target.state}.", ephemeral=True)
 
         
 async def setup(bot: commands.Bot):
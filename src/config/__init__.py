@@ -1,8 +1,30 @@
-from datetime import datetime
+import re
+from datetime import datetime, timedelta
 
 import discord
 
+_DURATION_UNITS = {"w": 604800, "d": 86400, "h": 3600, "m": 60, "s": 1}
+_DURATION = re.compile(r"(\d+)\s*([wdhms])")
+
+
 def relative_dt(dt: datetime) -> str:
     """Format the datetime in the relative timestamp form."""
 
-    return discord.utils.format_dt(dt, style="R")
\ No newline at end of file
+    return discord.utils.format_dt(dt, style="R")
+
+
+def parse_duration(text: str) -> timedelta:
+    """Parse a duration like "30m", "12h" or "1d12h" into a timedelta.
+
+    Raises:
+        ValueError: The text isn't a valid, positive duration
+    """
+
+    text = text.strip().lower()
+    parts = _DURATION.findall(text)
+    if not parts or _DURATION.sub("", text).strip():
+        raise ValueError(f"Invalid duration: {text}")
+    seconds = sum(int(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+    if seconds <= 0:
+        raise ValueError(f"Invalid duration: {text}")
+    return timedelta(seconds=seconds)
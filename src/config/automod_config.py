@@ -2,39 +2,77 @@
 
 Attributes:
     BANNED_WORDS (List[str])
+    MATCHER_BACKEND (str): The matcher engine, either "aho-corasick" or "regex"
+    VERDICT_CACHE_SIZE (int): How many verdicts the automod remembers
+    FLOOD_MEMBER_LIMIT (int): Messages a member may send within FLOOD_MEMBER_WINDOW
+    FLOOD_MEMBER_WINDOW (float): Member flood window, in seconds
+    FLOOD_CHANNEL_LIMIT (int): Messages a channel may receive within FLOOD_CHANNEL_WINDOW
+    FLOOD_CHANNEL_WINDOW (float): Channel flood window, in seconds
+    FLOOD_CHANNEL_MEMBER_MIN (int): Messages in a flooded channel that make a member an offender
+    FLOOD_MAX_TRACKED (int): Upper bound of tracked members and channels
+    FLOOD_IDLE_SECONDS (float): Inactivity after which a member or channel is forgotten
+    FLOOD_ACTIONS (List[str]): What happens to flooders, any of "delete", "timeout" and "warn"
+    FLOOD_TIMEOUT_SECONDS (int): Length of the flood timeout
+    BURST_THRESHOLD (int): Violations within BURST_WINDOW that switch a channel to burst mode
+    BURST_WINDOW (float): Burst detection window, in seconds
+    BURST_FLUSH_DELAY (float): How long violations are collected before a bulk delete
+    EDIT_TRACK_SIZE (int): Recent messages whose scanned content is remembered for edits
+    SWEEP_CHUNK_SIZE (int): Members checked per chunk by the nickname sweep
+    SWEEP_EDIT_INTERVAL (float): Pause between nickname sweep renames, in seconds
+    JOIN_CONCURRENCY (int): Joins processed at the same time
+    JOIN_WELCOME_WINDOW (float): Welcome messages are batched over this many seconds
+    JOIN_RAID_THRESHOLD (int): Joins within JOIN_RAID_WINDOW that switch to raid mode
+    JOIN_RAID_WINDOW (float): Raid detection window, in seconds
+    ESCALATION_RULES (List[str]): Warning thresholds and their actions, see `moderation.escalation`
+    BAN_EXPIRY_PREFETCH (int): Upcoming ban expiries the ban scheduler keeps in memory
 """
 from typing import List
 
+from decouple import Csv, config
+
+MATCHER_BACKEND: str = config("automod_matcher", "aho-corasick") # type: ignore
+VERDICT_CACHE_SIZE: int = config("automod_verdict_cache_size", 4096, cast=int) # type: ignore
+
+FLOOD_MEMBER_LIMIT: int = config("flood_member_limit", 6, cast=int) # type: ignore
+FLOOD_MEMBER_WINDOW: float = config("flood_member_window", 5.0, cast=float) # type: ignore
+FLOOD_CHANNEL_LIMIT: int = config("flood_channel_limit", 30, cast=int) # type: ignore
+FLOOD_CHANNEL_WINDOW: float = config("flood_channel_window", 5.0, cast=float) # type: ignore
+FLOOD_CHANNEL_MEMBER_MIN: int = config("flood_channel_member_min", 3, cast=int) # type: ignore
+FLOOD_MAX_TRACKED: int = config("flood_max_tracked", 50000, cast=int) # type: ignore
+FLOOD_IDLE_SECONDS: float = config("flood_idle_seconds", 60.0, cast=float) # type: ignore
+FLOOD_ACTIONS: List[str] = config("flood_actions", "delete,timeout,warn", cast=Csv()) # type: ignore
+FLOOD_TIMEOUT_SECONDS: int = config("flood_timeout_seconds", 300, cast=int) # type: ignore
+
+BURST_THRESHOLD: int = config("burst_threshold", 3, cast=int) # type: ignore
+BURST_WINDOW: float = config("burst_window", 10.0, cast=float) # type: ignore
+BURST_FLUSH_DELAY: float = config("burst_flush_delay", 2.0, cast=float) # type: ignore
+
+EDIT_TRACK_SIZE: int = config("automod_edit_track_size", 20000, cast=int) # type: ignore
+
+SWEEP_CHUNK_SIZE: int = config("sweep_chunk_size", 500, cast=int) # type: ignore
+SWEEP_EDIT_INTERVAL: float = config("sweep_edit_interval", 1.0, cast=float) # type: ignore
+
+JOIN_CONCURRENCY: int = config("join_concurrency", 4, cast=int) # type: ignore
+JOIN_WELCOME_WINDOW: float = config("join_welcome_window", 5.0, cast=float) # type: ignore
+JOIN_RAID_THRESHOLD: int = config("join_raid_threshold", 15, cast=int) # type: ignore
+JOIN_RAID_WINDOW: float = config("join_raid_window", 60.0, cast=float) # type: ignore
+
+ESCALATION_RULES: List[str] = config(
+    "escalation_rules", "3/3600:timeout:600,5/86400:timeout:86400,8/604800:ban", cast=Csv()
+) # type: ignore
+
+BAN_EXPIRY_PREFETCH: int = config("ban_expiry_prefetch", 64, cast=int) # type: ignore
+
+# Only the canonical spelling is needed, lookalike letters, leetspeak, casing and
+# separators ("f a g", "!f!a!g!") are folded away by `moderation.normalize`
 BANNED_WORDS: List[str] = [
-    "^FAGGOT",
-    "^TRANNY",
-    "f a g",
-    "f ag",
-    "fa g",
     "fag",
-    "FAG",
-    "FAGGOT",
-    "flag got",
+    "faggot",
     "flaggot",
-    "fаggot",
-    "FАGGOТ",
+    "f*gg*t",
     "gaF backwards",
     "tranny",
-    "*TRANNY*",
-    "TRANNY",
-    "TRANNУ",
-    "trаnny",
-    "!f!a!g!",
-    "!fag",
-    "*fag",
-    "fag!",
-    "faggot",
-    "FAGGOT",
-    "f*gg*t",
-    "fаg",
     "trannny",
-    "tranny",
-    "TRANNY",
     "ladyboy",
     "libtard"
 ]
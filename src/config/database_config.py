@@ -0,0 +1,76 @@
+"""Provides the database layer's configuration data
+
+The SQLite settings start from a named profile (`database_profile`), every single
+setting can still be overridden on its own.
+
+Profiles:
+    legacy: SQLite's defaults, rollback journal and a full fsync on every commit
+    durable: WAL journal, still fsyncs on every commit
+    wal: WAL journal, fsyncs only at checkpoints, the default
+
+Attributes:
+    DATABASE_URL (str): SQLAlchemy URL of the database
+    DATABASE_PROFILE (str): Name of the SQLite profile
+    SQLITE_PRAGMAS (Dict[str, Any]): Pragmas applied to every new connection
+    POOL_SIZE (int): Connections kept in the pool
+    POOL_MAX_OVERFLOW (int): Connections allowed on top of the pool
+    POOL_TIMEOUT (float): Seconds to wait for a free connection
+    WRITE_BEHIND_INTERVAL_MS (int): How often buffered moderation records are flushed
+    WRITE_BEHIND_MAX_ROWS (int): Buffered rows that trigger an early flush
+    WARNING_WINDOW (int): Trailing window of the per-member warning counters, in seconds
+    WARNING_BUCKET (int): Width of the buckets the window is counted in, in seconds
+    SLOW_QUERY_MS (float): Statements taking at least this long are logged as slow queries
+"""
+from typing import Any, Dict
+
+from decouple import config
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "legacy": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "busy_timeout": 5000,
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "busy_timeout": 5000,
+    },
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "busy_timeout": 5000,
+    },
+}
+
+DATABASE_URL: str = config("database_url", "sqlite:///database.db") # type: ignore
+DATABASE_PROFILE: str = config("database_profile", "wal") # type: ignore
+if DATABASE_PROFILE not in PROFILES:
+    raise RuntimeError(f"Unknown database profile: {DATABASE_PROFILE}")
+
+_profile = PROFILES[DATABASE_PROFILE]
+SQLITE_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": config("sqlite_journal_mode", _profile["journal_mode"]),
+    "synchronous": config("sqlite_synchronous", _profile["synchronous"]),
+    "cache_size": config("sqlite_cache_size", _profile["cache_size"], cast=int),
+    "mmap_size": config("sqlite_mmap_size", _profile["mmap_size"], cast=int),
+    "busy_timeout": config("sqlite_busy_timeout", _profile["busy_timeout"], cast=int),
+}
+
+POOL_SIZE: int = config("database_pool_size", 5, cast=int) # type: ignore
+POOL_MAX_OVERFLOW: int = config("database_pool_max_overflow", 10, cast=int) # type: ignore
+POOL_TIMEOUT: float = config("database_pool_timeout", 30.0, cast=float) # type: ignore
+
+WRITE_BEHIND_INTERVAL_MS: int = config("write_behind_interval_ms", 500, cast=int) # type: ignore
+WRITE_BEHIND_MAX_ROWS: int = config("write_behind_max_rows", 100, cast=int) # type: ignore
+
+WARNING_WINDOW: int = config("warning_window", 7 * 24 * 3600, cast=int) # type: ignore
+WARNING_BUCKET: int = config("warning_bucket", 3600, cast=int) # type: ignore
+
+SLOW_QUERY_MS: float = config("slow_query_ms", 100.0, cast=float) # type: ignore
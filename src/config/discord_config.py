@@ -7,14 +7,18 @@ if BOT_TOKEN is None:
     raise RuntimeError("No token specified!")
 if BOT_TOKEN == "bot.token.here" or BOT_TOKEN.count(".") != 2:
     raise RuntimeError("Invalid token specified!")
+# IDs are cast once they're known to be set, get_guild("123") finds nothing
 DEFAULT_ROLE: int = config("default_role", None)
 if DEFAULT_ROLE is None:
     raise RuntimeError("No role ID specified")
+DEFAULT_ROLE = int(DEFAULT_ROLE)
 GUILD: int = config("guild", None)
 if GUILD is None:
     raise RuntimeError("No guild ID specified")
+GUILD = int(GUILD)
 WELCOME_CHANNEL: int = config("welcome_channel", None)
 if WELCOME_CHANNEL is None:
     raise RuntimeError("No welcome channel ID specified")
+WELCOME_CHANNEL = int(WELCOME_CHANNEL)
 
 BOT_NAME = "Eternal"
@@ -1,4 +1,18 @@
 # config/transcript_config.py
+from decouple import config
+
+# Thread histories fetched at the same time by /transcript threads, across all exports
+TRANSCRIPT_THREAD_CONCURRENCY: int = config("transcript_thread_concurrency", 4, cast=int) # type: ignore
+# Transcript jobs running at the same time, across all guilds
+TRANSCRIPT_JOB_CONCURRENCY: int = config("transcript_job_concurrency", 2, cast=int) # type: ignore
+# Workers draining the job queue of each guild
+TRANSCRIPT_GUILD_WORKERS: int = config("transcript_guild_workers", 1, cast=int) # type: ignore
+# Seconds between edits of a job's status message
+TRANSCRIPT_PROGRESS_INTERVAL: float = config("transcript_progress_interval", 5, cast=float) # type: ignore
+# Messages rendered between two checkpoints of an incremental transcript
+TRANSCRIPT_CHECKPOINT_EVERY: int = config("transcript_checkpoint_every", 500, cast=int) # type: ignore
+
+
 async def createHeader(nameOfTranscript: str):
     header = f"""<!doctype html>
 <html lang="en">
@@ -0,0 +1,133 @@
+"""Incrementally maintained per-member warning counters
+
+Every flush that adds or deletes `WarningModel` rows updates the member's
+`WarningSummaryModel` row in the same transaction, so the total and the trailing
+window count can be read with a primary key lookup instead of a `COUNT` over the
+member's history.
+
+The window is counted in `WARNING_BUCKET` seconds wide buckets stored on the summary
+row. A flush adds its warnings to their buckets, subtracts the deleted ones and drops
+the buckets that left the window, the table itself is never counted. Readers sum the
+buckets still inside the window at the time they read, see
+`WarningSummaryModel.window_count`.
+
+Bulk deletes (`Query.delete`) skip the ORM events, use `clear_member_warnings` for
+those. If the counters ever drift, `rebuild_warning_summaries` recomputes them all
+from the raw table.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import delete, event, func, select
+
+from ..config.database_config import WARNING_BUCKET, WARNING_WINDOW
+from .database import Session
+from .models.warning import WarningModel
+from .models.warning_summary import WarningSummaryModel, bucket_of
+
+WINDOW = timedelta(seconds=WARNING_WINDOW)
+
+
+def window_count(summary: WarningSummaryModel, now: datetime | None = None) -> int:
+    """Warnings of the summary's member in the trailing `WARNING_WINDOW`."""
+    return summary.window_count(WINDOW, WARNING_BUCKET, now)
+
+
+@event.listens_for(Session, "before_flush")
+def _update_warning_summaries(session, flush_context, instances):
+    added: Dict[int, List[WarningModel]] = defaultdict(list)
+    deleted: Dict[int, List[WarningModel]] = defaultdict(list)
+    for obj in session.new:
+        if isinstance(obj, WarningModel):
+            added[obj.memberId].append(obj)
+    for obj in session.deleted:
+        if isinstance(obj, WarningModel):
+            deleted[obj.memberId].append(obj)
+    if not added and not deleted:
+        return
+
+    now = datetime.now()
+    first = bucket_of(now - WINDOW, WARNING_BUCKET)
+    with session.no_autoflush:
+        for member_id in set(added) | set(deleted):
+            new, gone = added[member_id], deleted[member_id]
+            summary = session.get(WarningSummaryModel, member_id)
+            if summary is None:
+                summary = WarningSummaryModel(member_id)
+                session.add(summary)
+            buckets = summary.get_buckets()
+            for warning in new:
+                if warning.time is not None:
+                    index = bucket_of(warning.time, WARNING_BUCKET)
+                    buckets[index] = buckets.get(index, 0) + 1
+            for warning in gone:
+                if warning.time is not None:
+                    index = bucket_of(warning.time, WARNING_BUCKET)
+                    if buckets.get(index):
+                        buckets[index] -= 1
+            summary.set_buckets({index: count for index, count in buckets.items() if index >= first})
+            summary.total = (summary.total or 0) + len(new) - len(gone)
+            summary.updated = now
+            if gone:
+                remaining = session.execute(
+                    select(func.max(WarningModel.time)).where(
+                        WarningModel.memberId == member_id,
+                        WarningModel.warningId.notin_([w.warningId for w in gone]),
+                    )
+                ).scalar()
+                summary.lastWarning = max([remaining, *(w.time for w in new)], key=lambda t: t or datetime.min)
+            else:
+                summary.lastWarning = max([summary.lastWarning, *(w.time for w in new)], key=lambda t: t or datetime.min)
+
+
+def clear_member_warnings(session, member_id: int) -> int:
+    """Deletes all warnings of a member together with their counters."""
+    deleted = (
+        session.query(WarningModel)
+        .filter_by(memberId=member_id)
+        .delete(synchronize_session=False)
+    )
+    session.query(WarningSummaryModel).filter_by(memberId=member_id).delete(synchronize_session=False)
+    return deleted
+
+
+def rebuild_warning_summaries(session) -> int:
+    """Recomputes every member's counters from the warnings table.
+
+    Works with both a session and a plain connection, so migrations can use it too.
+
+    Returns:
+        int: Number of members with warnings
+    """
+    now = datetime.now()
+    session.execute(delete(WarningSummaryModel))
+    counters = session.execute(
+        select(WarningModel.memberId, func.count(WarningModel.warningId), func.max(WarningModel.time))
+        .where(WarningModel.memberId.is_not(None))
+        .group_by(WarningModel.memberId)
+    ).all()
+    buckets: Dict[int, Dict[int, int]] = defaultdict(dict)
+    recent = session.execute(
+        select(WarningModel.memberId, WarningModel.time)
+        .where(WarningModel.memberId.is_not(None), WarningModel.time >= now - WINDOW)
+    )
+    for member_id, time in recent:
+        index = bucket_of(time, WARNING_BUCKET)
+        buckets[member_id][index] = buckets[member_id].get(index, 0) + 1
+
+    rows = []
+    for member_id, total, last_warning in counters:
+        summary = WarningSummaryModel(member_id)
+        summary.set_buckets(buckets.get(member_id, {}))
+        rows.append({
+            "memberId": member_id,
+            "total": total,
+            "lastWarning": last_warning,
+            "windowCount": summary.windowCount,
+            "buckets": summary.buckets,
+            "updated": now,
+        })
+    if rows:
+        session.execute(WarningSummaryModel.__table__.insert(), rows)
+    return len(rows)
@@ -1,18 +1,57 @@
-from contextlib import contextmanager
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, TypeVar
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from logging import Logger, getLogger
 
+from ..config.database_config import (
+    DATABASE_URL,
+    POOL_MAX_OVERFLOW,
+    POOL_SIZE,
+    POOL_TIMEOUT,
+    SQLITE_PRAGMAS,
+)
+
 transcript_logger: Logger = getLogger("Eternal.Database")
 
+
+def make_engine(url: str = DATABASE_URL, pragmas: Dict[str, Any] = SQLITE_PRAGMAS) -> Engine:
+    """Creates an engine, SQLite connections get the pragmas applied when they open."""
+    options: Dict[str, Any] = {}
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or parsed.database not in (None, "", ":memory:"):
+        # In memory SQLite uses a single connection pool without these knobs
+        options.update(pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+    new_engine = create_engine(url, echo=False, logging_name="SQLAlchemy", **options)
+
+    if parsed.get_backend_name() == "sqlite":
+        @event.listens_for(new_engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return new_engine
+
+
 # Create engine
-engine = create_engine("sqlite:///database.db", echo=False, logging_name="SQLAlchemy")
+engine = make_engine()
+transcript_logger.info("Using database %s with pragmas %s", engine.url.render_as_string(), SQLITE_PRAGMAS)
 
 # Create session maker
 Session = sessionmaker(bind=engine)
 
+# Time every statement and session
+from .instrumentation import caller_origin, instrument, query_origin  # noqa
+instrument(engine, Session)
+
 # Create declarative base
 Base = declarative_base()
 
@@ -20,10 +59,16 @@ Base = declarative_base()
 from .models.ban import BanModel  # noqa
 from .models.warning import WarningModel  # noqa
 from .models.automod_words import AutomodWordsModel  # noqa
+from .models.warning_summary import WarningSummaryModel  # noqa
+from . import counters  # noqa
 
 # Create tables
 Base.metadata.create_all(engine)
 
+# Upgrade existing tables
+from .migrations import run_migrations  # noqa
+run_migrations(engine)
+
 
 # Function to get a session with rollback capability
 @contextmanager
@@ -37,3 +82,73 @@ def get_session() -> Session: # type: ignore
         raise e
     finally:
         session.close()
+
+
+# All asynchronous database work runs on this one thread. SQLite only takes one
+# writer at a time anyway, and a single thread keeps each session on one thread.
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Eternal.Database")
+
+# An open session holds a pooled connection until it's closed, and closing happens
+# on the database thread too. With more open sessions than pooled connections the
+# thread would block on a checkout while the closes that free one wait behind it.
+MAX_ASYNC_SESSIONS = POOL_SIZE
+_session_slots: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+T = TypeVar("T")
+
+
+def _slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _session_slots.get(loop)
+    if slots is None:
+        # The cogs are loaded in a different event loop than the one the bot runs in
+        _session_slots.clear()
+        slots = _session_slots[loop] = asyncio.Semaphore(MAX_ASYNC_SESSIONS)
+    return slots
+
+
+class AsyncSession:
+    """A session living on the database thread, see `get_async_session`."""
+
+    def __init__(self, session):
+        self._session = session
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Runs `fn(session, *args)` on the database thread and returns its result."""
+        return await _on_db_thread(fn, self._session, *args)
+
+
+def _on_db_thread(fn: Callable[..., T], *args: Any) -> "asyncio.Future[T]":
+    # Executors don't carry context variables over, the query origin needs them
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(db_executor, context.run, fn, *args)
+
+
+@asynccontextmanager
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """Asynchronous counterpart of `get_session`, no SQL runs on the event loop.
+
+    Objects returned from `AsyncSession.run` stay readable after the session is closed,
+    but relationships and unloaded attributes can't be lazy loaded anymore.
+    """
+    # The call stack is only available here, on the event loop
+    origin = query_origin.set(query_origin.get() or caller_origin())
+    try:
+        async with _slots():
+            session = await _on_db_thread(lambda: Session(expire_on_commit=False))
+            try:
+                yield AsyncSession(session)
+                await _on_db_thread(session.commit)
+            except BaseException as e:
+                await _on_db_thread(session.rollback)
+                raise e
+            finally:
+                await _on_db_thread(session.close)
+    finally:
+        query_origin.reset(origin)
+
+
+async def run_in_session(fn: Callable[..., T], *args: Any) -> T:
+    """Shorthand for running one function in its own asynchronous session."""
+    async with get_async_session() as session:
+        return await session.run(fn, *args)
@@ -0,0 +1,45 @@
+"""Command line export and import of the moderation tables, see `database.transfer`
+
+Usage (from the repository root, with the bot's environment configured):
+    python -m src.database.export export [--format jsonl|csv] [--out DIR] [TABLE ...]
+    python -m src.database.export import [--keep-ids] [--table TABLE] FILE ...
+
+Importing the package opens the database named by `database_url` and brings its schema
+up to date, so set it to work on anything but the bot's own database, e.g.
+    database_url=sqlite:///backup.db python -m src.database.export export
+"""
+import argparse
+import os
+from typing import List, Optional
+
+from .transfer import FORMATS, TABLES, export_table, import_file
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m src.database.export", description="Export and import the moderation tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Export tables into files named after them")
+    export_parser.add_argument("tables", nargs="*", help=f"Tables to export, all by default ({', '.join(TABLES)})")
+    export_parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    export_parser.add_argument("--out", default=".", help="Directory the files are written to")
+    import_parser = commands.add_parser("import", help="Import files written by export")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("--table", choices=TABLES, help="Table to import into, read from the file names by default")
+    import_parser.add_argument("--keep-ids", action="store_true", help="Keep the exported IDs instead of assigning new ones")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        unknown = [name for name in args.tables if name not in TABLES]
+        if unknown:
+            parser.error(f"Unknown tables: {', '.join(unknown)}")
+        os.makedirs(args.out, exist_ok=True)
+        for name in args.tables or TABLES:
+            report = export_table(name, os.path.join(args.out, f"{name}.{args.format}"), args.format)
+            print(report.describe())
+    else:
+        for path in args.files:
+            print(import_file(path, args.table, keep_ids=args.keep_ids).describe())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Statement and session timing for the database layer
+
+Engine events time every statement, session events time every session transaction,
+from the first statement until the commit, rollback or close. The durations go into
+fixed-bucket latency histograms: one per distinct statement, one for all statements
+and one for sessions. Statements slower than `SLOW_QUERY_MS` are logged to
+`Eternal.Database` together with where they came from.
+
+The origin is the closest cog method on the call stack, e.g. `Administration /warning
+warnings` for a slash command or `AutoModeration.on_message` for a listener, and
+otherwise the closest module of the bot outside of the database layer. Asynchronous
+sessions capture it on the event loop when they open, `AsyncSession.run` carries it
+over to the database thread.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextvars import ContextVar
+from logging import Logger, getLogger
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..config.database_config import SLOW_QUERY_MS
+
+logger: Logger = getLogger("Eternal.Database")
+
+# Upper bounds of the histogram buckets, in milliseconds, the last bucket is unbounded
+BUCKETS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Distinct statements with their own histogram, the rest is counted under "other"
+MAX_STATEMENTS = 200
+
+query_origin: ContextVar[Optional[str]] = ContextVar("query_origin", default=None)
+
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_COG_DIRS = tuple(os.path.join(_SRC_DIR, name) + os.sep for name in ("commands", "events"))
+_DATABASE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+# Expanded IN lists and multi-row VALUES would make every length a new statement
+_PARAMETER_LISTS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def caller_origin() -> Optional[str]:
+    """Describes the closest code of the bot on the current call stack."""
+    fallback: Optional[str] = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_COG_DIRS):
+            owner = frame.f_locals.get("self")
+            name = type(owner).__name__ if owner is not None else os.path.splitext(os.path.basename(filename))[0]
+            interaction = frame.f_locals.get("interaction")
+            command = getattr(interaction, "command", None)
+            if command is not None:
+                return f"{name} /{command.qualified_name}"
+            return f"{name}.{frame.f_code.co_name}"
+        if fallback is None and filename.startswith(_SRC_DIR) and not filename.startswith(_DATABASE_DIR):
+            fallback = f"{os.path.splitext(os.path.basename(filename))[0]}.{frame.f_code.co_name}"
+        frame = frame.f_back # type: ignore
+    return fallback
+
+
+def normalize_statement(statement: str) -> str:
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return _PARAMETER_LISTS.sub("(?, ...)", statement)
+
+
+class LatencyHistogram:
+    """Counts of durations per bucket, plus their sum and maximum."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float):
+        self.counts[bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile, the maximum for the last one."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_ms": self.mean,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max,
+            "buckets": dict(zip([*map(str, BUCKETS), "inf"], self.counts)),
+        }
+
+
+class QueryStats:
+    """Aggregated statement and session latencies, shared by every thread.
+
+    Attributes:
+        slow (int): Statements over the slow query threshold
+    """
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self.statements: "OrderedDict[str, LatencyHistogram]" = OrderedDict()
+        self.all = LatencyHistogram()
+        self.sessions = LatencyHistogram()
+        self.slow = 0
+
+    def record_statement(self, statement: str, ms: float):
+        key = normalize_statement(statement)
+        with self._lock:
+            histogram = self.statements.get(key)
+            if histogram is None:
+                # Only the histogram goes into the catch-all, the slow query log keeps the statement
+                bucket = "other" if len(self.statements) >= MAX_STATEMENTS else key
+                histogram = self.statements.setdefault(bucket, LatencyHistogram())
+            histogram.add(ms)
+            self.all.add(ms)
+            if ms >= self.slow_ms:
+                self.slow += 1
+        if ms >= self.slow_ms:
+            origin = query_origin.get() or caller_origin() or "unknown"
+            logger.warning("Slow query (%.1f ms) from %s: %s", ms, origin, key[:500])
+
+    def record_session(self, ms: float):
+        with self._lock:
+            self.sessions.add(ms)
+
+    def top(self, n: int = 5) -> List[Tuple[str, Dict[str, Any]]]:
+        """The statements that took the most time in total."""
+        with self._lock:
+            ranked = sorted(self.statements.items(), key=lambda item: item[1].total, reverse=True)[:n]
+            return [(statement, histogram.snapshot()) for statement, histogram in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "statements": self.all.snapshot(),
+                "sessions": self.sessions.snapshot(),
+                "distinct": len(self.statements),
+                "slow": self.slow,
+                "slow_threshold_ms": self.slow_ms,
+            }
+
+
+query_stats = QueryStats()
+
+
+def instrument(engine: Engine, session_factory: Any, stats: QueryStats = query_stats):
+    """Times the statements of the engine and the sessions made by the factory."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        stats.record_statement(statement, (time.perf_counter() - started) * 1000)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # Failed statements never reach after_cursor_execute
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+    @event.listens_for(session_factory, "after_transaction_create")
+    def _after_transaction_create(session, transaction):
+        if transaction.parent is None:
+            session.info["transaction_start"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_transaction_end")
+    def _after_transaction_end(session, transaction):
+        if transaction.parent is None:
+            started = session.info.pop("transaction_start", None)
+            if started is not None:
+                stats.record_session((time.perf_counter() - started) * 1000)
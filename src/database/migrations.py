@@ -0,0 +1,99 @@
+"""Versioned schema migrations
+
+`Base.metadata.create_all` only creates missing tables, it never touches the ones
+that already exist. Everything that changes an existing table goes here instead, as a
+numbered migration. Applied versions are recorded in the `schema_migrations` table and
+every migration is written to be idempotent, so running them against a database that
+was created with the current models already in place is harmless.
+
+To add a migration, append a function decorated with `@migration(<next version>, ...)`.
+"""
+from datetime import datetime
+from logging import Logger, getLogger
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger: Logger = getLogger("Eternal.Database")
+
+Migration = Tuple[int, str, Callable[[Connection], None]]
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Registers the decorated function as the migration to `version`."""
+    def decorator(fn: Callable[[Connection], None]):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise RuntimeError(f"Migration {version} is out of order")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return decorator
+
+
+def _add_column(connection: Connection, table: str, column: str, definition: str):
+    columns = {c["name"] for c in inspect(connection).get_columns(table)}
+    if column not in columns:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+
+@migration(1, "Index warnings and bans by member and time")
+def _index_member_time(connection: Connection):
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_warnings_member_time ON warnings (memberId, time)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_bans_member_time ON bans (memberId, time)"))
+
+
+@migration(2, "Add guildId to warnings and bans")
+def _add_guild_id(connection: Connection):
+    _add_column(connection, "warnings", "guildId", "INTEGER")
+    _add_column(connection, "bans", "guildId", "INTEGER")
+
+
+@migration(3, "Build the per-member warning counters")
+def _build_warning_summaries(connection: Connection):
+    from .counters import rebuild_warning_summaries
+    rebuild_warning_summaries(connection)
+
+
+@migration(4, "Add action to bans")
+def _add_ban_action(connection: Connection):
+    _add_column(connection, "bans", "action", "VARCHAR NOT NULL DEFAULT 'ban'")
+
+
+@migration(5, "Track when bans are lifted")
+def _add_ban_lifted(connection: Connection):
+    _add_column(connection, "bans", "lifted", "DATETIME")
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_bans_pending_expiry ON bans (lifted, action, expires)"))
+
+
+@migration(6, "Index the bans in effect by guild and time")
+def _index_active_bans(connection: Connection):
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_bans_active ON bans (lifted, action, guildId, time)"))
+
+
+@migration(7, "Count the warning window in buckets")
+def _add_warning_buckets(connection: Connection):
+    _add_column(connection, "warning_summaries", "buckets", "VARCHAR NOT NULL DEFAULT '{}'")
+    from .counters import rebuild_warning_summaries
+    rebuild_warning_summaries(connection)
+
+
+def run_migrations(engine: Engine):
+    """Applies every migration newer than the database, each in its own transaction."""
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description VARCHAR, applied DATETIME)"
+        ))
+        current = connection.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar() or 0
+
+    for version, description, fn in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as connection:
+            fn(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, description, applied) VALUES (:v, :d, :a)"),
+                {"v": version, "d": description, "a": datetime.now()},
+            )
+        logger.info("Applied database migration %d: %s", version, description)
@@ -1,19 +1,31 @@
 from ..database import Base
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from discord import Member
 from datetime import datetime
 
 class BanModel(Base):
     __tablename__ = 'bans'
+    # Also created for existing databases by migrations 1, 5 and 6
+    __table_args__ = (
+        Index('ix_bans_member_time', 'memberId', 'time'),
+        Index('ix_bans_pending_expiry', 'lifted', 'action', 'expires'),
+        Index('ix_bans_active', 'lifted', 'action', 'guildId', 'time'),
+    )
     banId = Column(Integer, primary_key=True)
     memberId = Column(Integer)
-    moderatorId = Column(Integer)
+    guildId = Column(Integer, nullable=True)
+    moderatorId = Column(Integer) # None when banned outside of the bot
     reason = Column(String)
     time = Column(DateTime)
     expires = Column(DateTime, nullable=True) # Default is None
-    def __init__(self, member: Member, moderator: Member, reason: str, expires: DateTime | None = None):
+    action = Column(String, nullable=False, default='ban') # "ban" or "timeout"
+    lifted = Column(DateTime, nullable=True) # When the ban expired, was revoked or replaced
+    def __init__(self, member: Member, moderator: Member | None, reason: str, expires: DateTime | None = None, action: str = 'ban'):
         self.memberId = member.id
-        self.moderatorId = moderator.id
+        guild = getattr(member, "guild", None)
+        self.guildId = guild.id if guild is not None else None
+        self.moderatorId = moderator.id if moderator is not None else None
         self.reason = reason
         self.time = datetime.now()
         self.expires = expires
+        self.action = action
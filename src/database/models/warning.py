@@ -1,17 +1,22 @@
 from ..database import Base
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from discord import Member
 from datetime import datetime
 
 class WarningModel(Base):
     __tablename__ = 'warnings'
+    # Also created for existing databases by migration 1
+    __table_args__ = (Index('ix_warnings_member_time', 'memberId', 'time'),)
     warningId = Column(Integer, primary_key=True)
     memberId = Column(Integer)
+    guildId = Column(Integer, nullable=True)
     moderatorId = Column(Integer)
     reason = Column(String)
     time = Column(DateTime)
     def __init__(self, member: Member, moderator: Member, reason: str):
         self.memberId = member.id
+        guild = getattr(member, "guild", None)
+        self.guildId = guild.id if guild is not None else None
         self.moderatorId = moderator.id
         self.reason = reason
         self.time = datetime.now()
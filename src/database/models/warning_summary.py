@@ -0,0 +1,49 @@
+from ..database import Base
+from sqlalchemy import Column, Integer, DateTime, String
+from datetime import datetime, timedelta
+from typing import Dict
+import json
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_of(time: datetime, width: int) -> int:
+    """Index of the `width` seconds long bucket holding `time`."""
+    return int((time - EPOCH).total_seconds() // width)
+
+
+class WarningSummaryModel(Base):
+    """Per-member warning counters, kept up to date by `database.counters`."""
+    __tablename__ = 'warning_summaries'
+    memberId = Column(Integer, primary_key=True, autoincrement=False)
+    total = Column(Integer, nullable=False, default=0)
+    lastWarning = Column(DateTime, nullable=True)
+    windowCount = Column(Integer, nullable=False, default=0) # Warnings in the trailing window as of `updated`
+    buckets = Column(String, nullable=False, default="{}") # JSON, bucket index -> warnings, only buckets still in the window
+    updated = Column(DateTime)
+    def __init__(self, memberId: int):
+        self.memberId = memberId
+        self.total = 0
+        self.windowCount = 0
+        self.buckets = "{}"
+        self.updated = datetime.now()
+
+    def get_buckets(self) -> Dict[int, int]:
+        return {int(index): count for index, count in json.loads(self.buckets or "{}").items()}
+
+    def set_buckets(self, buckets: Dict[int, int]):
+        self.buckets = json.dumps({str(index): count for index, count in sorted(buckets.items()) if count > 0})
+        self.windowCount = sum(buckets.values())
+
+    def window_count(self, window: timedelta, width: int, now: datetime | None = None) -> int:
+        """Warnings in the trailing window, counted from the buckets still inside it.
+
+        The bucket holding the start of the window is counted whole, so warnings are
+        counted up to `width` seconds after they left the window.
+        """
+        if now is None:
+            now = datetime.now()
+        if self.lastWarning is None or self.lastWarning < now - window:
+            return 0
+        first = bucket_of(now - window, width)
+        return sum(count for index, count in self.get_buckets().items() if index >= first)
@@ -0,0 +1,209 @@
+"""Streaming export and import of the moderation tables
+
+Exports read the table with a server-side cursor (`yield_per`), so memory use doesn't
+grow with the table, and write one row per line as JSON Lines or CSV. Imports parse the
+file lazily as well and insert `IMPORT_BATCH` rows per transaction with Core inserts.
+Rows that are already in the table are skipped, so importing the same file twice adds
+nothing: with their exported IDs kept they clash on the ID (or the banned word), with
+new IDs warnings and bans are matched on guild, member, reason and time instead
+(`NATURAL_KEYS`). Both report their throughput.
+
+Imported warnings bypass the ORM, so the warning counters are rebuilt afterwards.
+Imported banned words only reach the automod after `/moderation reload`.
+
+The command line entry point lives in `database.export`, the admin commands in the
+Administration cog.
+"""
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from logging import Logger, getLogger
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from sqlalchemy import DateTime, Integer, Table, and_, bindparam, exists, insert, select
+
+from .counters import rebuild_warning_summaries
+from .database import engine, get_session
+from .models.automod_words import AutomodWordsModel
+from .models.ban import BanModel
+from .models.warning import WarningModel
+
+logger: Logger = getLogger("Eternal.Database")
+
+TABLES: Dict[str, Table] = {
+    model.__tablename__: model.__table__ # type: ignore
+    for model in (WarningModel, BanModel, AutomodWordsModel)
+}
+FORMATS = ("jsonl", "csv")
+
+# Columns identifying a row whose ID isn't kept, NULL matches NULL
+NATURAL_KEYS: Dict[str, tuple] = {
+    WarningModel.__tablename__: ("guildId", "memberId", "reason", "time"),
+    BanModel.__tablename__: ("guildId", "memberId", "reason", "time"),
+}
+
+# Rows fetched per round trip while exporting
+EXPORT_BATCH = 1000
+# Rows inserted per transaction while importing
+IMPORT_BATCH = 5000
+
+
+class TransferReport(NamedTuple):
+    table: str
+    rows: int
+    skipped: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.rows / max(self.seconds, 1e-9)
+
+    def describe(self) -> str:
+        skipped = f", {self.skipped} skipped" if self.skipped else ""
+        return f"{self.table}: {self.rows} rows in {self.seconds:.2f} s ({self.rate:.0f} rows/s){skipped}"
+
+
+def _encode(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _decode(table: Table, record: Dict[str, Any], keep_ids: bool) -> Dict[str, Any]:
+    row: Dict[str, Any] = {}
+    for name, value in record.items():
+        column = table.columns.get(name)
+        # Columns the file has but this schema doesn't are dropped
+        if column is None or (column.primary_key and not keep_ids):
+            continue
+        if value is None or (value == "" and column.nullable):
+            row[name] = None
+        elif isinstance(column.type, DateTime) and isinstance(value, str):
+            row[name] = datetime.fromisoformat(value)
+        elif isinstance(column.type, Integer):
+            row[name] = int(value)
+        else:
+            row[name] = value
+    return row
+
+
+def _read(path: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def table_of(path: str) -> str:
+    """The table a file was exported from, by its name.
+
+    Only the start of the name counts, `warnings.jsonl` as well as a renamed
+    `warnings_1.jsonl` or `warnings (2).jsonl`.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    for table in sorted(TABLES, key=len, reverse=True):
+        if name == table or name.startswith((f"{table}_", f"{table}-", f"{table} ")):
+            return table
+    raise ValueError(f"Unknown table {name}, expected one of {', '.join(TABLES)}")
+
+
+def format_of(path: str) -> str:
+    fmt = os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of {', '.join(FORMATS)}")
+    return fmt
+
+
+def _insert_new(table: Table, columns: List[str], key: tuple):
+    """INSERT ... SELECT that only inserts a row if no row with the same `key` columns exists."""
+    values = [bindparam(column, type_=table.columns[column].type) for column in columns]
+    duplicate = exists().where(and_(*(
+        table.columns[column].is_not_distinct_from(bindparam(column, type_=table.columns[column].type))
+        for column in key
+    )))
+    return insert(table).from_select(columns, select(*values).where(~duplicate))
+
+
+def export_table(name: str, path: str, fmt: str = "jsonl", batch_size: int = EXPORT_BATCH) -> TransferReport:
+    """Streams every row of the table into the file at `path`."""
+    table = TABLES[name]
+    start = time.perf_counter()
+    rows = 0
+    with get_session() as session, open(path, "w", encoding="utf-8", newline="") as f:
+        result = session.execute(
+            select(table).order_by(*table.primary_key.columns).execution_options(yield_per=batch_size)
+        )
+        columns = list(result.keys())
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(columns)
+        for row in result:
+            values = [_encode(value) for value in row]
+            if writer is not None:
+                writer.writerow(values)
+            else:
+                f.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False))
+                f.write("\n")
+            rows += 1
+    report = TransferReport(name, rows, 0, time.perf_counter() - start)
+    logger.info("Exported %s", report.describe())
+    return report
+
+
+def import_file(
+    path: str,
+    name: Optional[str] = None,
+    keep_ids: bool = False,
+    batch_size: int = IMPORT_BATCH,
+) -> TransferReport:
+    """Inserts the rows of an exported file, the format follows from its name.
+
+    The table does too unless `name` is given. IDs are reassigned unless `keep_ids`
+    is set, so the rows can be added to a database that already has its own.
+    """
+    name = name or table_of(path)
+    table = TABLES[name]
+    key = None if keep_ids else NATURAL_KEYS.get(name)
+    # Duplicates are skipped instead of failing the whole batch
+    ignore = insert(table).prefix_with("OR IGNORE", dialect="sqlite")
+    start = time.perf_counter()
+    rows = 0
+    skipped = 0
+    batch: List[Dict[str, Any]] = []
+
+    def flush():
+        nonlocal rows, skipped
+        inserted = 0
+        with engine.begin() as connection:
+            if key is None:
+                inserted = connection.execute(ignore, batch).rowcount
+            else:
+                # Rows with the same columns share a statement, executed row by row so
+                # duplicates within the file are caught as well
+                groups: Dict[tuple, List[Dict[str, Any]]] = {}
+                for row in batch:
+                    groups.setdefault(tuple(row), []).append(row)
+                for columns, group in groups.items():
+                    if not set(key) <= set(columns):
+                        raise KeyError(f"{name} rows need the columns {', '.join(key)}")
+                    inserted += connection.execute(_insert_new(table, list(columns), key), group).rowcount
+        rows += inserted
+        skipped += len(batch) - inserted
+        batch.clear()
+
+    for record in _read(path, format_of(path)):
+        batch.append(_decode(table, record, keep_ids))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if name == WarningModel.__tablename__:
+        with engine.begin() as connection:
+            rebuild_warning_summaries(connection)
+    report = TransferReport(name, rows, skipped, time.perf_counter() - start)
+    logger.info("Imported %s", report.describe())
+    return report
@@ -0,0 +1,151 @@
+"""Write-behind buffer for moderation records
+
+Automod hits can come in hundreds per second during a raid, committing each warning
+on its own would block the event loop on an fsync every time. Instead the rows are
+buffered here and written in one transaction every `WRITE_BEHIND_INTERVAL_MS`
+milliseconds or once `WRITE_BEHIND_MAX_ROWS` rows are waiting, whichever comes first.
+The transaction itself runs on the database thread.
+
+Readers that need to see buffered rows should `await moderation_writer.flush()` first.
+
+Attributes:
+    moderation_writer (WriteBehindQueue): The queue used for automod records.
+"""
+import asyncio
+import atexit
+import time
+from logging import Logger, getLogger
+from typing import Any, Dict, List, Optional
+
+from ..config.database_config import WRITE_BEHIND_INTERVAL_MS, WRITE_BEHIND_MAX_ROWS
+from .database import Session, db_executor
+
+logger: Logger = getLogger("Eternal.Database")
+
+
+class WriteBehindQueue:
+    """Buffers ORM objects and inserts them in batches.
+
+    Attributes:
+        flush_count (int): Number of transactions written so far
+        flushed_rows (int): Number of rows written so far
+        last_flush_latency (float): Duration of the last flush, in seconds
+        max_flush_latency (float): Longest flush so far, in seconds
+    """
+
+    def __init__(self, interval_ms: int = WRITE_BEHIND_INTERVAL_MS, max_rows: int = WRITE_BEHIND_MAX_ROWS):
+        self.interval = interval_ms / 1000
+        self.max_rows = max_rows
+        self._pending: List[Any] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.flush_count = 0
+        self.flushed_rows = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Number of rows waiting to be written."""
+        return len(self._pending)
+
+    def add(self, row: Any):
+        """Queues a row for insertion.
+
+        Without a running event loop (scripts, shutdown) the row is written right away.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._write([row])
+            return
+        self._pending.append(row)
+        self._bind_loop()
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._run()) # type: ignore
+        if len(self._pending) >= self.max_rows:
+            self._wakeup.set() # type: ignore
+
+    async def flush(self):
+        """Writes everything that is currently buffered."""
+        self._bind_loop()
+        async with self._flush_lock: # type: ignore
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            start = time.perf_counter()
+            try:
+                await asyncio.get_running_loop().run_in_executor(db_executor, self._write, rows)
+            except Exception:
+                logger.exception("Failed to write %d buffered rows, requeueing them", len(rows))
+                self._pending[:0] = rows
+                return
+            latency = time.perf_counter() - start
+            self.flush_count += 1
+            self.flushed_rows += len(rows)
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            logger.debug("Flushed %d rows in %.1f ms", len(rows), latency * 1000)
+
+    async def close(self):
+        """Stops the background flusher and writes the remaining rows."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "depth": self.depth,
+            "flush_count": self.flush_count,
+            "flushed_rows": self.flushed_rows,
+            "last_flush_latency_ms": self.last_flush_latency * 1000,
+            "max_flush_latency_ms": self.max_flush_latency * 1000,
+        }
+
+    def _bind_loop(self):
+        # The cogs are loaded in a different event loop than the one the bot runs in,
+        # so everything loop bound is created lazily and recreated if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval) # type: ignore
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear() # type: ignore
+            await self.flush()
+
+    @staticmethod
+    def _write(rows: List[Any]):
+        session = Session()
+        try:
+            session.add_all(rows)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def _flush_at_exit(self):
+        # Last resort if the bot died without unloading the cogs
+        if self._pending:
+            rows, self._pending = self._pending, []
+            self._write(rows)
+
+
+moderation_writer = WriteBehindQueue()
+atexit.register(moderation_writer._flush_at_exit)
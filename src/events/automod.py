@@ -1,63 +1,112 @@
-import re
-from string import ascii_letters as STANDARD_CHARACTERS
-from typing import List
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import timedelta
+from hashlib import blake2b
+from typing import Dict, List
 
 import discord
 from discord.ext import commands
 
-from ..config.automod_config import BANNED_WORDS
-from ..database import get_session
+from ..config.automod_config import EDIT_TRACK_SIZE, FLOOD_ACTIONS, FLOOD_TIMEOUT_SECONDS
+from ..database import moderation_writer
 from ..database.models.warning import WarningModel
-from .. database.models.automod_words import AutomodWordsModel
+from ..moderation.escalation import EscalationEngine
+from ..moderation.burst import NOTICE, NOTICE_LIFETIME, BurstCoalescer
+from ..moderation.flood import FloodDetector, Offenders
+from ..moderation.joins import JoinPipeline
+from ..moderation.matcher import matcher_cache
+from ..moderation.normalize import normalize
+from ..moderation.sweep import NicknameSweep
+from ..moderation.verdict_cache import verdict_cache
 
-from ..config.discord_config import DEFAULT_ROLE, GUILD, WELCOME_CHANNEL
+from ..config.discord_config import GUILD
 
+logger: logging.Logger = logging.getLogger("Eternal.Events")
 
-def remove_non_standard_characters(s: str) -> str:
-    return re.sub(f"[^{re.escape(STANDARD_CHARACTERS)}]", "", s)
 
+class AutoModeration(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.flood = FloodDetector()
+        self.bursts = BurstCoalescer()
+        self.out_dir = os.path.join(os.path.dirname(__file__), 'out')
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.escalation = EscalationEngine(bot)
+        self.joins = JoinPipeline(bot, self.moderate_nickname)
+        self.sweep = NicknameSweep(os.path.join(self.out_dir, 'nickname_sweep.json'), self.rename_member)
+        # message id -> digest of the normalized content it was last scanned with
+        self._scanned: "OrderedDict[int, bytes]" = OrderedDict()
+        self.edits_skipped = 0
+        self.edits_scanned = 0
 
-def get_banned_words_from_db() -> List[str]:
-    banned_words: List[str] = []
-    with get_session() as session:
-        words = session.query(AutomodWordsModel).all()
-        banned_words = [word.word for word in words]
-    return banned_words
 
+    async def cog_load(self) -> None:
+        # Build the matcher once, it's only rebuilt when the word list changes
+        await matcher_cache.reload_async()
 
-class AutoModeration(commands.Cog):
-    banned_words: List[str]
 
-    def __init__(self, bot: commands.Bot):
-        self.bot = bot
-        self.banned_words = [remove_non_standard_characters(i) for i in BANNED_WORDS]
+    async def cog_unload(self) -> None:
+        # Also runs on shutdown, bot.close() removes every cog
+        await self.sweep.stop()
+        await self.joins.close()
+        await self.bursts.close()
+        await moderation_writer.close()
 
 
     # Listeners 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready fires again after reconnects, a finished sweep returns right away
+        if not self.sweep.running:
+            self.start_nickname_sweep()
+
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         author: discord.Member = message.author # type: ignore
         content: str = message.content
         channel: discord.TextChannel = message.channel # type: ignore
-        if self.is_string_blacklisted(content.lower()):
-            await message.delete()
-            # Warn the sender
-            warning = WarningModel(
-                author, self.bot.user, "Sending inappropriate messages (Automod)" # type: ignore
-            )
-            with get_session() as session:
-                session.add(warning)
-                session.commit()
-            await channel.send(
-                f"Don't send inappropriate messages, {author.mention}", delete_after=5.0
-            )
+        if message.guild is not None and not author.bot:
+            offenders = self.flood.record(author.id, channel.id, message.id)
+            if offenders:
+                await self.punish_flood(message.guild, offenders)
+                if author.id in offenders:
+                    # The message is deleted with the rest of the flood
+                    return
+        normalized = normalize(content)
+        if self.is_normalized_blacklisted(normalized):
+            await self.handle_violation(message)
+        else:
+            self._remember_scan(message.id, normalized)
+
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # Embed unfurls and pins arrive as edits too, those carry no content
+        if "content" not in payload.data or payload.guild_id is None:
+            return
+        message = payload.message
+        if message.author.bot:
+            return
+        normalized = normalize(message.content)
+        digest = self._digest(normalized)
+        if self._scanned.get(message.id) == digest:
+            self.edits_skipped += 1
+            return
+        self.edits_scanned += 1
+        if self.is_normalized_blacklisted(normalized):
+            self._scanned.pop(message.id, None)
+            await self.handle_violation(message)
+        else:
+            self._remember_scan(message.id, normalized, digest)
 
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
-        await self.moderate_nickname(member)
-        await member.add_roles(self._guild().get_role(DEFAULT_ROLE))
-        await self._guild().get_channel(WELCOME_CHANNEL).send(f"Welcome to the server {member.name}")
+        # Nickname check, default role and welcome message are handled by the pipeline
+        self.joins.add(member)
     
 
     @commands.Cog.listener()
@@ -67,6 +116,17 @@ class AutoModeration(commands.Cog):
         await self.moderate_nickname(after)
 
 
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        # The pipeline caches the default role and welcome channel
+        self.joins.invalidate()
+
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.joins.invalidate()
+
+
     # Methods - Moderation
     async def moderate_nickname(self, member: discord.Member):
         """Checks whether the member's nickname contains a banned word. If it does, renames the user.
@@ -74,44 +134,117 @@ class AutoModeration(commands.Cog):
         Args:
             member (discord.Member): The member to check
         """
-        if any(bw in remove_non_standard_characters(member.display_name.lower()) for bw in self.banned_words):
-            await member.edit(nick="Moderated Nickname")
-            # Warn the member
-            warning = WarningModel(
-                member, self.bot.user, "Inappropriate nickname or username (Automod)" # type: ignore
+        name = normalize(member.display_name)
+        # Nicknames have no word boundaries to speak of, any substring counts
+        if verdict_cache.check(name, matcher_cache.get(), whole_words=False):
+            await self.rename_member(member)
+
+
+    async def rename_member(self, member: discord.Member):
+        """Replaces the member's nickname and warns them for it."""
+        await member.edit(nick="Moderated Nickname")
+        # Warn the member
+        await self.warn(member, "Inappropriate nickname or username (Automod)")
+
+
+    def start_nickname_sweep(self):
+        """Checks every member already in the guild against the current word list."""
+        guild = self._guild()
+        if guild is None:
+            logger.warning("Guild %s not found, skipping the nickname sweep", GUILD)
+            return
+        self.sweep.start(guild)
+
+
+    async def handle_violation(self, message: discord.Message):
+        """Deletes a message containing banned words and warns its author."""
+        author: discord.Member = message.author # type: ignore
+        # During a burst the message is deleted in bulk along with the rest
+        if not self.bursts.add(message):
+            await message.delete()
+            await message.channel.send(
+                NOTICE.format(mentions=author.mention), delete_after=NOTICE_LIFETIME
             )
-            with get_session() as session:
-                session.add(warning)
-                session.commit()
+        # Warn the sender
+        await self.warn(author, "Sending inappropriate messages (Automod)")
+
+
+    async def warn(self, member: discord.Member, reason: str):
+        """Records an automod warning and escalates if the member crossed a threshold."""
+        if isinstance(member, discord.Member):
+            await self.escalation.load(member.id)
+        moderation_writer.add(WarningModel(member, self.bot.user, reason)) # type: ignore
+        if isinstance(member, discord.Member):
+            await self.escalation.record(member)
+
+
+    async def punish_flood(self, guild: discord.Guild, offenders: Offenders):
+        """Deletes the flood, times out and warns the offenders, all in bulk.
+
+        Args:
+            guild (discord.Guild): The guild the flood happened in
+            offenders (Offenders): Offending member IDs with their messages
+        """
+        logger.info("Flood detected in guild %s, offenders: %s", guild.id, ", ".join(map(str, offenders)))
+        members = [m for m in map(guild.get_member, offenders) if m is not None]
+
+        if "delete" in FLOOD_ACTIONS:
+            by_channel: Dict[int, List[discord.Object]] = {}
+            for messages in offenders.values():
+                for channel_id, message_id in messages:
+                    by_channel.setdefault(channel_id, []).append(discord.Object(id=message_id))
+            for channel_id, messages in by_channel.items():
+                channel = guild.get_channel_or_thread(channel_id)
+                if channel is None:
+                    continue
+                # Bulk delete takes at most 100 messages per call
+                for i in range(0, len(messages), 100):
+                    try:
+                        await channel.delete_messages(messages[i:i + 100]) # type: ignore
+                    except discord.HTTPException as e:
+                        logger.warning("Failed to delete flood messages in channel %s: %s", channel_id, e)
+
+        if "timeout" in FLOOD_ACTIONS:
+            until = timedelta(seconds=FLOOD_TIMEOUT_SECONDS)
+            results = await asyncio.gather(
+                *(member.timeout(until, reason="Flooding (Automod)") for member in members),
+                return_exceptions=True,
+            )
+            for member, result in zip(members, results):
+                if isinstance(result, Exception):
+                    logger.warning("Failed to time out member %s: %s", member.id, result)
+
+        if "warn" in FLOOD_ACTIONS:
+            for member in members:
+                await self.warn(member, "Flooding the chat (Automod)")
 
 
     def is_string_blacklisted(self, s: str) -> bool:
         """Checks whether the given string contains any banned words."""
 
-        banned_from_db = get_banned_words_from_db()
+        return self.is_normalized_blacklisted(normalize(s))
 
-        # Clean banned words from config + DB
-        self.banned_words = [
-            remove_non_standard_characters(i) for i in BANNED_WORDS
-        ]
-        self.banned_words.extend(
-            remove_non_standard_characters(i) for i in banned_from_db
-        )
 
-        # Clean the input string
-        s = remove_non_standard_characters(s)
+    def is_normalized_blacklisted(self, normalized: str) -> bool:
+        """Checks whether the already normalized string contains any banned words."""
 
-        # Build safe regex with word boundaries
-        pattern = r"\b(" + "|".join(
-            re.escape(word) for word in self.banned_words if word
-        ) + r")\b"
-        
-        self._compiled_pattern = re.compile(pattern, re.IGNORECASE)
-        
-        return bool(self._compiled_pattern.search(s))
+        return verdict_cache.check(normalized, matcher_cache.get())
 
 
     # Methods - Helper
+    @staticmethod
+    def _digest(normalized: str) -> bytes:
+        return blake2b(normalized.encode(), digest_size=16).digest()
+
+
+    def _remember_scan(self, message_id: int, normalized: str, digest: bytes | None = None):
+        """Remembers what a clean message looked like, so unchanged edits are skipped."""
+        self._scanned[message_id] = digest or self._digest(normalized)
+        self._scanned.move_to_end(message_id)
+        if len(self._scanned) > EDIT_TRACK_SIZE:
+            self._scanned.popitem(last=False)
+
+
     def _guild(self):
         return self.bot.get_guild(GUILD)
 
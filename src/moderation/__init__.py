@@ -0,0 +1,2 @@
+from .matcher import matcher_cache
+from .verdict_cache import verdict_cache
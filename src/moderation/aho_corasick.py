@@ -0,0 +1,90 @@
+"""A small Aho-Corasick automaton used for banned word matching
+
+Scanning is linear in the length of the text no matter how many words are in
+the automaton, which a single alternation regex cannot promise.
+"""
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    """Same rules as the regex `\\b`: a word character on exactly one side."""
+    before = index > 0 and _is_word_char(text[index - 1])
+    after = index < len(text) and _is_word_char(text[index])
+    return before != after
+
+
+class AhoCorasick:
+    """Multi-pattern matcher built once from a list of words.
+
+    The automaton is stored as flat lists indexed by state, every state keeps its
+    transitions, its failure link and the lengths of the words ending in it
+    (including the ones reachable through failure links).
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        for word in words:
+            if word:
+                self._add(word)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def _add(self, word: str):
+        state = 0
+        for c in word:
+            nxt = self._goto[state].get(c)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][c] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        if len(word) not in self._out[state]:
+            self._out[state] += (len(word),)
+
+    def _build(self):
+        # Breadth first so every failure target is finished before it's used
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(c, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yields the (start, end) span of every word occurrence in the text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, c in enumerate(text):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            for length in out[state]:
+                yield i + 1 - length, i + 1
+
+    def search(self, text: str, whole_words: bool = True) -> bool:
+        """Checks whether the text contains any of the words.
+
+        Args:
+            text (str): The text to scan
+            whole_words (bool): Only count matches delimited by word boundaries
+        """
+        for start, end in self.finditer(text):
+            if not whole_words or (_is_boundary(text, start) and _is_boundary(text, end)):
+                return True
+        return False
@@ -0,0 +1,252 @@
+"""Lifts temporary bans once they expire
+
+Temporary bans are `BanModel` rows with `action == "ban"`, an `expires` time and no
+`lifted` time yet. Instead of polling the table, the scheduler keeps only the next
+`BAN_EXPIRY_PREFETCH` expiries in a min-heap, sleeps until the earliest one is due,
+lifts everything that's due in one batch and loads the following expiries (keyset
+paginated on expiry and ban ID) once it got past the loaded ones. Bans added in the
+meantime wake it up when they expire before the last loaded one.
+
+Nothing is kept outside of the database, so after a restart the first load simply
+returns every ban that expired while the bot was offline and they're all lifted in
+one batch.
+"""
+import asyncio
+import heapq
+from datetime import datetime
+from logging import Logger, getLogger
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import discord
+from sqlalchemy import or_
+
+from ..config.automod_config import BAN_EXPIRY_PREFETCH
+from ..database import run_in_session
+from ..database.models.ban import BanModel
+
+logger: Logger = getLogger("Eternal.Administration")
+
+# (expires, ban id, member id)
+Expiry = Tuple[datetime, int, int]
+
+# Longest single sleep, so a changed system clock is noticed eventually
+MAX_SLEEP = 3600.0
+# Failed unbans are retried after this many seconds
+RETRY_DELAY = 60.0
+
+
+def _pending_bans(session, member_id: Optional[int] = None):
+    query = session.query(BanModel).filter(
+        BanModel.lifted.is_(None), # type: ignore
+        BanModel.action == "ban",
+    )
+    if member_id is not None:
+        query = query.filter(BanModel.memberId == member_id)
+    return query
+
+
+def record_ban(session, ban: BanModel) -> int:
+    """Stores a new ban, replacing the member's earlier bans that are still in effect.
+
+    Returns:
+        int: The ID of the new ban
+    """
+    now = datetime.now()
+    _pending_bans(session, ban.memberId).update({BanModel.lifted: now}, synchronize_session=False) # type: ignore
+    session.add(ban)
+    session.flush()
+    return ban.banId # type: ignore
+
+
+def lift_bans(session, member_id: int) -> int:
+    """Marks every ban of the member that's still in effect as lifted.
+
+    Returns:
+        int: How many bans were lifted
+    """
+    return _pending_bans(session, member_id).update({BanModel.lifted: datetime.now()}, synchronize_session=False) # type: ignore
+
+
+def _load_expiries(session, after: Optional[Expiry], limit: int) -> Tuple[List[Expiry], bool]:
+    query = (
+        _pending_bans(session)
+        .filter(BanModel.expires.isnot(None)) # type: ignore
+        .order_by(BanModel.expires, BanModel.banId)
+        .with_entities(BanModel.expires, BanModel.banId, BanModel.memberId)
+    )
+    overdue = []
+    if after is None:
+        # First load, everything that expired while the bot was offline goes in one batch
+        overdue = query.filter(BanModel.expires <= datetime.now()).all()
+        if overdue:
+            last = overdue[-1]
+            after = (last.expires, last.banId, last.memberId)
+    if after is not None:
+        query = query.filter(
+            BanModel.expires >= after[0],
+            or_(BanModel.expires > after[0], BanModel.banId > after[1]),
+        )
+    rows = query.limit(limit).all()
+    # Whether there may be more expiries after these
+    return [(row.expires, row.banId, row.memberId) for row in overdue + rows], len(rows) >= limit
+
+
+def _still_pending(session, ban_ids: List[int]) -> Dict[int, int]:
+    rows = (
+        _pending_bans(session)
+        .filter(BanModel.banId.in_(ban_ids)) # type: ignore
+        .with_entities(BanModel.banId, BanModel.memberId)
+        .all()
+    )
+    return {row.banId: row.memberId for row in rows}
+
+
+def _mark_lifted(session, ban_ids: List[int]):
+    if ban_ids:
+        session.query(BanModel).filter(BanModel.banId.in_(ban_ids)).update( # type: ignore
+            {BanModel.lifted: datetime.now()}, synchronize_session=False
+        )
+
+
+class BanExpiryScheduler:
+    """Unbans members when their temporary ban runs out.
+
+    Attributes:
+        lifted (int): Bans lifted since the bot started
+        batches (int): Batches of due bans processed
+    """
+
+    def __init__(self, prefetch: int = BAN_EXPIRY_PREFETCH):
+        self.prefetch = prefetch
+        self._heap: List[Expiry] = []
+        # Last expiry loaded into the heap, the next refill continues after it
+        self._cursor: Optional[Expiry] = None
+        # Expiry of the cursor, None once every pending ban is loaded
+        self._horizon: Optional[datetime] = datetime.min
+        self._refilling = False
+        # Bans scheduled while a refill is running, merged in once it's done
+        self._late: List[Expiry] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.lifted = 0
+        self.batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, guild: discord.Guild):
+        """Starts lifting the guild's expired bans, restarting the scheduler if it runs."""
+        if self.running:
+            self._task.cancel() # type: ignore
+        # Forget everything in memory, the first refill reloads it from the database
+        self._heap = []
+        self._cursor = None
+        self._horizon = datetime.min
+        self._late = []
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run(guild))
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel() # type: ignore
+            try:
+                await self._task # type: ignore
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def schedule(self, ban_id: int, member_id: int, expires: datetime):
+        """Tells the scheduler about a temporary ban that was just stored."""
+        entry = (expires, ban_id, member_id)
+        if self._refilling:
+            self._late.append(entry)
+        elif self._horizon is None or expires <= self._horizon:
+            heapq.heappush(self._heap, entry)
+        else:
+            # Expires after everything loaded, a later refill picks it up
+            return
+        if self._wake is not None:
+            self._wake.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": self.running,
+            "queued": len(self._heap),
+            "lifted": self.lifted,
+            "batches": self.batches,
+        }
+
+    async def _refill(self):
+        self._refilling = True
+        try:
+            expiries, more = await run_in_session(_load_expiries, self._cursor, self.prefetch)
+        finally:
+            self._refilling = False
+        if more:
+            self._cursor = expiries[-1]
+            self._horizon = self._cursor[0]
+        else:
+            self._horizon = None
+        # Late bans may have been loaded as well, `_lift` skips the duplicates
+        self._heap.extend(expiries + self._late)
+        self._late = []
+        heapq.heapify(self._heap)
+
+    async def _run(self, guild: discord.Guild):
+        wake: asyncio.Event = self._wake # type: ignore
+        while True:
+            # Everything up to the horizon is in the heap, anything later might not be
+            if self._horizon is not None and (not self._heap or self._heap[0][0] > self._horizon):
+                await self._refill()
+                continue
+            wake.clear()
+            now = datetime.now()
+            if not self._heap or self._heap[0][0] > now:
+                delay = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                try:
+                    await asyncio.wait_for(wake.wait(), min(delay, MAX_SLEEP) if delay is not None else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due: List[Expiry] = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap))
+            try:
+                await self._lift(guild, due)
+            except Exception:
+                logger.exception("Failed lifting %d expired bans", len(due))
+                self._retry(due)
+
+    async def _lift(self, guild: discord.Guild, due: Iterable[Expiry]):
+        entries = {ban_id: (expires, ban_id, member_id) for expires, ban_id, member_id in due}
+        # Bans may have been revoked or replaced since they were loaded
+        pending = await run_in_session(_still_pending, list(entries))
+        lifted: List[int] = []
+        failed: List[Expiry] = []
+        for ban_id, member_id in pending.items():
+            try:
+                await guild.unban(discord.Object(id=member_id), reason="Temporary ban expired")
+            except discord.NotFound:
+                # Already unbanned by hand
+                pass
+            except discord.HTTPException as e:
+                logger.warning("Failed to lift the ban of member %s: %s", member_id, e)
+                failed.append(entries[ban_id])
+                continue
+            lifted.append(ban_id)
+        await run_in_session(_mark_lifted, lifted)
+        self._retry(failed)
+        self.lifted += len(lifted)
+        self.batches += 1
+        if lifted:
+            logger.info("Lifted %d expired bans", len(lifted))
+
+    def _retry(self, entries: Iterable[Expiry]):
+        retry_at = datetime.fromtimestamp(datetime.now().timestamp() + RETRY_DELAY)
+        for _, ban_id, member_id in entries:
+            heapq.heappush(self._heap, (retry_at, ban_id, member_id))
+
+
+ban_scheduler = BanExpiryScheduler()
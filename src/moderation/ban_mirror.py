@@ -0,0 +1,155 @@
+"""Local copy of the guild's ban list
+
+Bans in effect are the `BanModel` rows with `action == "ban"` and no `lifted` time.
+`on_member_ban` and `on_member_unban` keep them in sync with Discord, including bans
+made outside of the bot, and a bulk backfill imports the bans that predate the mirror
+once per guild. Listing bans is then a query on the `ix_bans_active` index instead
+of paging the whole ban list over REST.
+"""
+import json
+import os
+from datetime import datetime
+from logging import Logger, getLogger
+from typing import List, Optional, Set, Tuple
+
+import discord
+from sqlalchemy import desc, or_
+
+from ..database import run_in_session
+from ..database.models.ban import BanModel
+from .ban_expiry import lift_bans
+
+logger: Logger = getLogger("Eternal.Administration")
+
+# Rows inserted per flush during the backfill
+BACKFILL_CHUNK = 1000
+
+# (time, ban id) of the last ban on the previous page
+BanKey = Tuple[datetime, int]
+
+
+def _active_bans(session, guild_id: int):
+    return session.query(BanModel).filter(
+        BanModel.lifted.is_(None), # type: ignore
+        BanModel.action == "ban",
+        BanModel.guildId == guild_id,
+    )
+
+
+def mirror_ban(session, guild_id: int, user_id: int, moderator_id: Optional[int], reason: Optional[str]) -> bool:
+    """Records a ban made on Discord unless it's already recorded, e.g. by `/ban member`.
+
+    Returns:
+        bool: Whether a new row was stored
+    """
+    if _active_bans(session, guild_id).filter(BanModel.memberId == user_id).first() is not None:
+        return False
+    ban = BanModel(discord.Object(id=user_id), None, reason or "No reason provided") # type: ignore
+    ban.guildId = guild_id
+    ban.moderatorId = moderator_id
+    session.add(ban)
+    return True
+
+
+def list_bans(session, guild_id: int, after: Optional[BanKey], limit: int) -> List[BanModel]:
+    """Bans in effect, newest first, starting after the given key."""
+    query = _active_bans(session, guild_id)
+    if after is not None:
+        query = query.filter(
+            BanModel.time <= after[0],
+            or_(BanModel.time < after[0], BanModel.banId < after[1]),
+        )
+    return query.order_by(desc(BanModel.time), desc(BanModel.banId)).limit(limit).all() # type: ignore
+
+
+def _backfill(session, guild_id: int, bans: List[Tuple[int, Optional[str]]]) -> Tuple[int, int]:
+    banned: Set[int] = {user_id for user_id, _ in bans}
+    known: Set[int] = set()
+    lifted = 0
+    # Rows from before guildId was recorded belong to this guild too, the bot only serves one
+    rows = session.query(BanModel).filter(
+        BanModel.lifted.is_(None), # type: ignore
+        BanModel.action == "ban",
+        or_(BanModel.guildId == guild_id, BanModel.guildId.is_(None)), # type: ignore
+    ).all()
+    now = datetime.now()
+    for row in rows:
+        if row.memberId in banned:
+            row.guildId = guild_id
+            known.add(row.memberId)
+        else:
+            # Unbanned while the bot wasn't watching
+            row.lifted = now
+            lifted += 1
+
+    added = 0
+    for user_id, reason in bans:
+        if user_id in known:
+            continue
+        ban = BanModel(discord.Object(id=user_id), None, reason or "No reason provided") # type: ignore
+        ban.guildId = guild_id
+        session.add(ban)
+        added += 1
+        if added % BACKFILL_CHUNK == 0:
+            session.flush()
+    return added, lifted
+
+
+class BanMirror:
+    """Keeps the `BanModel` rows of one guild in sync with its Discord ban list."""
+
+    def __init__(self, store_path: str):
+        self._store_path = store_path
+
+    async def on_ban(self, guild: discord.Guild, user: discord.abc.User):
+        moderator_id, reason = await self._audit_entry(guild, user)
+        if await run_in_session(mirror_ban, guild.id, user.id, moderator_id, reason):
+            logger.info("Mirrored ban of user %s (ID: %s)", user, user.id)
+
+    async def on_unban(self, guild: discord.Guild, user: discord.abc.User):
+        # Lifting bans that are already lifted, e.g. by `/ban remove`, changes nothing
+        if await run_in_session(lift_bans, user.id):
+            logger.info("Mirrored unban of user %s (ID: %s)", user, user.id)
+
+    async def backfill(self, guild: discord.Guild, force: bool = False) -> Optional[Tuple[int, int]]:
+        """Imports the guild's Discord ban list, once unless forced.
+
+        Returns:
+            Optional[Tuple[int, int]]: Bans added and bans lifted, None if it already ran
+        """
+        if not force and self._load_checkpoint().get(str(guild.id)):
+            return None
+        bans: List[Tuple[int, Optional[str]]] = [(entry.user.id, entry.reason) async for entry in guild.bans(limit=None)]
+        added, lifted = await run_in_session(_backfill, guild.id, bans)
+        checkpoint = self._load_checkpoint()
+        checkpoint[str(guild.id)] = datetime.now().isoformat()
+        self._save_checkpoint(checkpoint)
+        logger.info("Ban mirror backfilled: %d bans on Discord, %d added, %d lifted", len(bans), added, lifted)
+        return added, lifted
+
+    async def _audit_entry(self, guild: discord.Guild, user: discord.abc.User) -> Tuple[Optional[int], Optional[str]]:
+        try:
+            async for entry in guild.audit_logs(limit=5, action=discord.AuditLogAction.ban):
+                if entry.target is not None and entry.target.id == user.id:
+                    return (entry.user.id if entry.user else None), entry.reason
+        except discord.HTTPException:
+            # Missing the audit log permission, the ban is still mirrored
+            pass
+        return None, None
+
+    # Persistence
+    def _load_checkpoint(self) -> dict:
+        try:
+            if os.path.exists(self._store_path):
+                with open(self._store_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception:
+            logger.exception("Failed loading the ban mirror checkpoint")
+        return {}
+
+    def _save_checkpoint(self, checkpoint: dict):
+        try:
+            with open(self._store_path, "w", encoding="utf-8") as f:
+                json.dump(checkpoint, f, indent=2)
+        except Exception:
+            logger.exception("Failed saving the ban mirror checkpoint")
@@ -0,0 +1,122 @@
+"""Coalescing of automod deletes and notices during bursts
+
+Normally every violation costs two REST calls, deleting the message and sending the
+notice. Once a channel sees `BURST_THRESHOLD` violations within `BURST_WINDOW`
+seconds it switches to burst mode: violations are collected for `BURST_FLUSH_DELAY`
+seconds and then removed with one bulk delete and one notice mentioning everyone.
+"""
+import asyncio
+import time
+from collections import deque
+from logging import Logger, getLogger
+from typing import Deque, Dict, List
+
+import discord
+
+from ..config.automod_config import BURST_FLUSH_DELAY, BURST_THRESHOLD, BURST_WINDOW
+
+logger: Logger = getLogger("Eternal.Events")
+
+NOTICE = "Don't send inappropriate messages, {mentions}"
+NOTICE_LIFETIME = 5.0
+
+
+class BurstCoalescer:
+    """Decides per channel whether violations are handled one by one or in bulk.
+
+    Attributes:
+        coalesced (int): Violations handled through a bulk flush
+        flushes (int): Bulk flushes done
+    """
+
+    def __init__(self, threshold: int = BURST_THRESHOLD, window: float = BURST_WINDOW, delay: float = BURST_FLUSH_DELAY):
+        self.threshold = threshold
+        self.window = window
+        self.delay = delay
+        self._recent: Dict[int, Deque[float]] = {}
+        self._pending: Dict[int, List[discord.Message]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._next_prune = 0.0
+        self.coalesced = 0
+        self.flushes = 0
+
+    def add(self, message: discord.Message) -> bool:
+        """Records a violating message.
+
+        Returns:
+            bool: True if the message was taken over by a burst, the caller must not
+                delete it or send a notice itself.
+        """
+        channel_id = message.channel.id
+        now = time.monotonic()
+        if now >= self._next_prune:
+            self._prune(now)
+        recent = self._recent.get(channel_id)
+        if recent is None:
+            recent = self._recent[channel_id] = deque(maxlen=self.threshold)
+        recent.append(now)
+        while recent and now - recent[0] > self.window:
+            recent.popleft()
+        if len(recent) < self.threshold and channel_id not in self._pending:
+            return False
+
+        self.coalesced += 1
+        self._pending.setdefault(channel_id, []).append(message)
+        if channel_id not in self._tasks:
+            self._tasks[channel_id] = asyncio.get_running_loop().create_task(self._flush_later(channel_id))
+        return True
+
+    async def close(self):
+        """Flushes every pending burst right away."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        self._tasks.clear()
+        for channel_id in list(self._pending):
+            await self.flush(channel_id)
+
+    async def flush(self, channel_id: int):
+        messages = self._pending.pop(channel_id, [])
+        if not messages:
+            return
+        self.flushes += 1
+        channel = messages[0].channel
+        if hasattr(channel, "delete_messages"):
+            # Bulk delete takes at most 100 messages per call
+            for i in range(0, len(messages), 100):
+                try:
+                    await channel.delete_messages(messages[i:i + 100]) # type: ignore
+                except discord.HTTPException as e:
+                    logger.warning("Failed to bulk delete %d messages in channel %s: %s", len(messages), channel_id, e)
+        else:
+            # DMs and partial channels have no bulk delete
+            for message in messages:
+                try:
+                    await message.delete()
+                except discord.HTTPException as e:
+                    logger.warning("Failed to delete message %s in channel %s: %s", message.id, channel_id, e)
+        mentions = " ".join(dict.fromkeys(message.author.mention for message in messages))
+        try:
+            await channel.send(NOTICE.format(mentions=mentions), delete_after=NOTICE_LIFETIME)
+        except discord.HTTPException as e:
+            logger.warning("Failed to send the automod notice in channel %s: %s", channel_id, e)
+        logger.info("Coalesced %d automod violations in channel %s", len(messages), channel_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "bursting": len(self._pending),
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+        }
+
+    def _prune(self, now: float):
+        """Forgets channels without a violation in the last window, at most once per window."""
+        self._next_prune = now + self.window
+        for channel_id in [c for c, recent in self._recent.items() if now - recent[-1] > self.window]:
+            del self._recent[channel_id]
+
+    async def _flush_later(self, channel_id: int):
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self._tasks.pop(channel_id, None)
+        await self.flush(channel_id)
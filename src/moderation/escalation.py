@@ -0,0 +1,180 @@
+"""Automatic escalation of repeated automod warnings
+
+Rules are read from `ESCALATION_RULES`, each one as `<warnings>/<window>:<action>[:<duration>]`
+with the window and duration in seconds, e.g. `3/3600:timeout:600` times a member out
+for ten minutes once they collected three warnings within an hour. The action is either
+`timeout` or `ban`, a ban with a duration is temporary.
+
+Decisions are made from an in-memory ring buffer of each member's recent warning times.
+The buffer is seeded once per member from the warning counters (and, only if those
+show recent warnings, the latest few rows through the member/time index), never from
+the full history. `invalidate` and `reset` drop buffers whose warnings were cleared or
+rebuilt, so old history can't escalate a new infraction. Every action taken is recorded as a `BanModel` row, temporary bans
+are handed to the ban scheduler in `moderation.ban_expiry`.
+"""
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from logging import Logger, getLogger
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import discord
+from sqlalchemy import desc
+
+from ..config.automod_config import ESCALATION_RULES
+from ..database import moderation_writer, run_in_session
+from ..database.models.ban import BanModel
+from ..database.models.warning import WarningModel
+from ..database.counters import WINDOW, window_count
+from ..database.models.warning_summary import WarningSummaryModel
+from .ban_expiry import ban_scheduler, record_ban
+
+logger: Logger = getLogger("Eternal.Events")
+
+# Upper bound of members whose recent warnings are kept in memory
+MAX_TRACKED = 50000
+
+
+class EscalationRule(NamedTuple):
+    count: int
+    window: float
+    action: str
+    duration: Optional[float]
+
+    def describe(self) -> str:
+        return f"{self.count} warnings within {timedelta(seconds=self.window)}"
+
+
+def parse_rules(specs: List[str]) -> List[EscalationRule]:
+    """Parses the rule strings, sorted from the mildest to the most severe."""
+    rules: List[EscalationRule] = []
+    for spec in specs:
+        threshold, _, rest = spec.strip().partition(":")
+        count, _, window = threshold.partition("/")
+        action, _, duration = rest.partition(":")
+        if action not in ("timeout", "ban") or not count or not window:
+            raise RuntimeError(f"Invalid escalation rule: {spec}")
+        if action == "timeout" and not duration:
+            raise RuntimeError(f"Escalation rule needs a timeout duration: {spec}")
+        rules.append(EscalationRule(int(count), float(window), action, float(duration) if duration else None))
+    return sorted(rules, key=lambda rule: (rule.action == "ban", rule.count))
+
+
+def _load_recent_warnings(session, member_id: int, cutoff: datetime, limit: int) -> List[datetime]:
+    summary = session.get(WarningSummaryModel, member_id)
+    if summary is None:
+        return []
+    # The counters only cover `WARNING_WINDOW`, rules with a longer window always read the rows
+    if datetime.now() - cutoff <= WINDOW and window_count(summary) == 0:
+        return []
+    rows = (
+        session.query(WarningModel.time)
+        .filter(WarningModel.memberId == member_id, WarningModel.time >= cutoff)
+        .order_by(desc(WarningModel.time))
+        .limit(limit)
+        .all()
+    )
+    return [row.time for row in reversed(rows)]
+
+
+class EscalationEngine:
+    """Turns repeated warnings into timeouts and bans.
+
+    Attributes:
+        actions (int): Escalations carried out so far
+    """
+
+    def __init__(self, bot: discord.Client, rules: List[EscalationRule] | None = None):
+        self.bot = bot
+        self.rules = parse_rules(ESCALATION_RULES) if rules is None else rules
+        self._depth = max((rule.count for rule in self.rules), default=0)
+        self._window = max((rule.window for rule in self.rules), default=0)
+        # member id -> timestamps of their recent warnings
+        self._history: "OrderedDict[int, Deque[float]]" = OrderedDict()
+        # member id -> (index of the last rule applied, when)
+        self._applied: Dict[int, Tuple[int, float]] = {}
+        self.actions = 0
+
+    async def record(self, member: discord.Member) -> Optional[EscalationRule]:
+        """Records a new warning of the member and escalates if a rule is crossed.
+
+        Returns:
+            Optional[EscalationRule]: The rule that was applied, if any
+        """
+        if not self.rules:
+            return None
+        now = time.time()
+        history = await self._member_history(member.id, now)
+        history.append(now)
+
+        for index in range(len(self.rules) - 1, -1, -1):
+            rule = self.rules[index]
+            if sum(1 for t in history if now - t <= rule.window) < rule.count:
+                continue
+            applied = self._applied.get(member.id)
+            if applied is not None and applied[0] >= index and now - applied[1] <= rule.window:
+                # Already punished at least this hard for the same warnings
+                return None
+            self._applied[member.id] = (index, now)
+            await self._apply(member, rule)
+            return rule
+        return None
+
+    async def load(self, member_id: int):
+        """Seeds the member's warnings from the database unless they are already in memory.
+
+        Has to run before a new warning is queued, otherwise the seed could read it back
+        and it would be counted twice.
+        """
+        await self._member_history(member_id, time.time())
+
+    def invalidate(self, member_id: int):
+        """Forgets the member's warnings, e.g. after they were cleared. Reseeded on the next one."""
+        self._history.pop(member_id, None)
+        self._applied.pop(member_id, None)
+
+    def reset(self):
+        """Forgets every member's warnings, e.g. after the warnings table was rebuilt or imported."""
+        self._history.clear()
+        self._applied.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self._history), "actions": self.actions}
+
+    async def _member_history(self, member_id: int, now: float) -> Deque[float]:
+        history = self._history.get(member_id)
+        if history is not None:
+            self._history.move_to_end(member_id)
+            return history
+        cutoff = datetime.fromtimestamp(now - self._window)
+        # Older warnings may still sit in the write-behind buffer
+        await moderation_writer.flush()
+        recent = await run_in_session(_load_recent_warnings, member_id, cutoff, self._depth)
+        # A concurrent warning of the same member may have seeded it in the meantime
+        history = self._history.setdefault(member_id, deque((t.timestamp() for t in recent), maxlen=self._depth))
+        if len(self._history) > MAX_TRACKED:
+            evicted, _ = self._history.popitem(last=False)
+            self._applied.pop(evicted, None)
+        return history
+
+    async def _apply(self, member: discord.Member, rule: EscalationRule):
+        reason = f"Automatic escalation: {rule.describe()}"
+        expires = datetime.now() + timedelta(seconds=rule.duration) if rule.duration else None
+        try:
+            if rule.action == "timeout":
+                await member.timeout(timedelta(seconds=rule.duration), reason=reason) # type: ignore
+            else:
+                await member.ban(reason=reason, delete_message_seconds=0)
+        except discord.HTTPException as e:
+            logger.warning("Failed to %s member %s: %s", rule.action, member.id, e)
+            return
+        self.actions += 1
+        ban = BanModel(member, self.bot.user, reason, expires, action=rule.action) # type: ignore
+        if rule.action == "ban":
+            # Needs its ID right away so a temporary ban can be scheduled for lifting
+            ban_id = await run_in_session(record_ban, ban)
+            if expires is not None:
+                ban_scheduler.schedule(ban_id, member.id, expires)
+        else:
+            moderation_writer.add(ban)
+        logger.info("Escalated member %s to %s (%s)", member.id, rule.action, rule.describe())
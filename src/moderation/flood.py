@@ -0,0 +1,146 @@
+"""Rate based flood detection for the automod
+
+Every tracked member and channel owns a fixed size ring buffer of its latest
+messages. A member floods once their buffer fills up within `FLOOD_MEMBER_WINDOW`
+seconds, a channel floods once its buffer does within `FLOOD_CHANNEL_WINDOW`.
+Buffers are kept in LRU order and the idle ones are evicted, so memory stays bounded
+by `FLOOD_MAX_TRACKED` no matter how many members are active.
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ..config.automod_config import (
+    FLOOD_CHANNEL_LIMIT,
+    FLOOD_CHANNEL_MEMBER_MIN,
+    FLOOD_CHANNEL_WINDOW,
+    FLOOD_IDLE_SECONDS,
+    FLOOD_MAX_TRACKED,
+    FLOOD_MEMBER_LIMIT,
+    FLOOD_MEMBER_WINDOW,
+)
+
+# (timestamp, other id, message id), the other id is the channel for member buffers
+# and the member for channel buffers
+Entry = Tuple[float, int, int]
+# member id -> [(channel id, message id), ...]
+Offenders = Dict[int, List[Tuple[int, int]]]
+
+# Idle eviction is amortized, it only runs every this many messages
+_EVICT_EVERY = 256
+
+
+class FloodDetector:
+    """Tracks message rates per member and per channel over sliding windows.
+
+    Attributes:
+        member_trips (int): How many times a single member flooded
+        channel_trips (int): How many times a channel flooded
+    """
+
+    def __init__(
+        self,
+        member_limit: int = FLOOD_MEMBER_LIMIT,
+        member_window: float = FLOOD_MEMBER_WINDOW,
+        channel_limit: int = FLOOD_CHANNEL_LIMIT,
+        channel_window: float = FLOOD_CHANNEL_WINDOW,
+        channel_member_min: int = FLOOD_CHANNEL_MEMBER_MIN,
+        max_tracked: int = FLOOD_MAX_TRACKED,
+        idle_seconds: float = FLOOD_IDLE_SECONDS,
+    ):
+        self.member_limit = member_limit
+        self.member_window = member_window
+        self.channel_limit = channel_limit
+        self.channel_window = channel_window
+        self.channel_member_min = channel_member_min
+        self.max_tracked = max_tracked
+        self.idle_seconds = idle_seconds
+        self._members: "OrderedDict[int, Deque[Entry]]" = OrderedDict()
+        self._channels: "OrderedDict[int, Deque[Entry]]" = OrderedDict()
+        self._since_eviction = 0
+        self.member_trips = 0
+        self.channel_trips = 0
+
+    def record(self, member_id: int, channel_id: int, message_id: int, now: Optional[float] = None) -> Offenders:
+        """Records a message and returns the members that are flooding, if any.
+
+        Args:
+            member_id (int): The author's ID
+            channel_id (int): The channel's ID
+            message_id (int): The message's ID
+            now (float): Monotonic timestamp, defaults to `time.monotonic()`
+
+        Returns:
+            Offenders: The flooding members with the messages that should go
+        """
+        if now is None:
+            now = time.monotonic()
+        member_buffer = self._buffer(self._members, member_id, self.member_limit)
+        member_buffer.append((now, channel_id, message_id))
+        channel_buffer = self._buffer(self._channels, channel_id, self.channel_limit)
+        channel_buffer.append((now, member_id, message_id))
+
+        self._since_eviction += 1
+        if self._since_eviction >= _EVICT_EVERY:
+            self._since_eviction = 0
+            self.evict_idle(now)
+
+        offenders: Offenders = {}
+        if self._is_full(channel_buffer, self.channel_limit, self.channel_window, now):
+            self.channel_trips += 1
+            counts: Dict[int, List[Tuple[int, int]]] = {}
+            for _, author_id, msg_id in channel_buffer:
+                counts.setdefault(author_id, []).append((channel_id, msg_id))
+            offenders = {
+                author_id: messages for author_id, messages in counts.items()
+                if len(messages) >= self.channel_member_min
+            }
+            channel_buffer.clear()
+
+        if self._is_full(member_buffer, self.member_limit, self.member_window, now):
+            self.member_trips += 1
+            offenders.setdefault(member_id, [])
+            known = set(offenders[member_id])
+            offenders[member_id].extend(
+                (ch_id, msg_id) for _, ch_id, msg_id in member_buffer if (ch_id, msg_id) not in known
+            )
+
+        for offender_id in offenders:
+            # Start counting from zero again, otherwise every next message trips again
+            self._members.pop(offender_id, None)
+        return offenders
+
+    def evict_idle(self, now: Optional[float] = None):
+        """Drops the buffers that saw no message for `idle_seconds`."""
+        if now is None:
+            now = time.monotonic()
+        cutoff = now - self.idle_seconds
+        for buffers in (self._members, self._channels):
+            # LRU order, so the idlest buffers are at the front
+            while buffers:
+                key, buffer = next(iter(buffers.items()))
+                if buffer and buffer[-1][0] >= cutoff:
+                    break
+                buffers.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "members": len(self._members),
+            "channels": len(self._channels),
+            "member_trips": self.member_trips,
+            "channel_trips": self.channel_trips,
+        }
+
+    def _buffer(self, buffers: "OrderedDict[int, Deque[Entry]]", key: int, size: int) -> Deque[Entry]:
+        buffer = buffers.get(key)
+        if buffer is None:
+            buffer = buffers[key] = deque(maxlen=size)
+            if len(buffers) > self.max_tracked:
+                buffers.popitem(last=False)
+        else:
+            buffers.move_to_end(key)
+        return buffer
+
+    @staticmethod
+    def _is_full(buffer: Deque[Entry], limit: int, window: float, now: float) -> bool:
+        return len(buffer) >= limit and now - buffer[0][0] <= window
@@ -0,0 +1,230 @@
+"""Join processing pipeline
+
+Every join used to cost a nickname check, a role grant and a welcome message, all
+done inline. When a raid brings hundreds of accounts in a minute that floods both the
+rate limits and the welcome channel. Joins are queued here instead:
+
+- The guild, default role and welcome channel are resolved once and cached.
+- Role grants and nickname checks run on `JOIN_CONCURRENCY` workers.
+- Welcome messages are batched into one message per `JOIN_WELCOME_WINDOW` seconds.
+- Once `JOIN_RAID_THRESHOLD` members join within `JOIN_RAID_WINDOW` seconds the
+  pipeline switches to raid mode. Raiders still get their role, but their nickname
+  checks are deferred and no welcome is sent while the raid lasts. When the join rate
+  drops, the deferred nicknames are checked one after another and a single welcome
+  states how many members joined.
+
+The join rate is re-checked on a timer while in raid mode, so the mode ends once the
+raid does, not on the next join.
+"""
+import asyncio
+import time
+from collections import deque
+from logging import Logger, getLogger
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+from ..config.automod_config import (
+    JOIN_CONCURRENCY,
+    JOIN_RAID_THRESHOLD,
+    JOIN_RAID_WINDOW,
+    JOIN_WELCOME_WINDOW,
+)
+from ..config.discord_config import DEFAULT_ROLE, GUILD, WELCOME_CHANNEL
+
+logger: Logger = getLogger("Eternal.Events")
+
+# Keep the welcome message well under the 2000 characters limit
+_MAX_LISTED_NAMES = 50
+
+
+class JoinPipeline:
+    """Queues joins and processes them with bounded concurrency.
+
+    Attributes:
+        processed (int): Joins processed so far
+        raid_mode (bool): Whether the join rate is currently above the raid threshold
+    """
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        moderate: Callable[[discord.Member], Awaitable[None]],
+        concurrency: int = JOIN_CONCURRENCY,
+        welcome_window: float = JOIN_WELCOME_WINDOW,
+        raid_threshold: int = JOIN_RAID_THRESHOLD,
+        raid_window: float = JOIN_RAID_WINDOW,
+    ):
+        self.bot = bot
+        self._moderate = moderate
+        self.concurrency = concurrency
+        self.welcome_window = welcome_window
+        self.raid_threshold = raid_threshold
+        self.raid_window = raid_window
+        self._resolved: Optional[Tuple[discord.Guild, discord.Role, discord.abc.Messageable]] = None
+        self._joins: Deque[float] = deque(maxlen=raid_threshold)
+        self._welcome: List[str] = []
+        self._welcome_count = 0
+        # Raiders whose nickname check waits for the raid to end
+        self._deferred: List[discord.Member] = []
+        self._raid_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._welcome_task: Optional[asyncio.Task] = None
+        self.processed = 0
+        self.raid_mode = False
+
+    def resolve(self) -> Optional[Tuple[discord.Guild, discord.Role, discord.abc.Messageable]]:
+        """Returns the cached guild, default role and welcome channel."""
+        if self._resolved is None:
+            guild = self.bot.get_guild(GUILD)
+            if guild is None:
+                return None
+            role = guild.get_role(DEFAULT_ROLE)
+            channel = guild.get_channel(WELCOME_CHANNEL)
+            if role is None or channel is None:
+                logger.warning("Default role or welcome channel not found in guild %s", GUILD)
+                return None
+            self._resolved = (guild, role, channel) # type: ignore
+        return self._resolved
+
+    def invalidate(self):
+        """Forgets the resolved objects, e.g. after the role or channel changed."""
+        self._resolved = None
+
+    def add(self, member: discord.Member):
+        """Queues a freshly joined member."""
+        self._bind_loop()
+        now = time.monotonic()
+        self._joins.append(now)
+        self.update_raid_mode(now)
+        self._queue.put_nowait(member) # type: ignore
+        self._welcome_count += 1
+        if len(self._welcome) <= _MAX_LISTED_NAMES:
+            self._welcome.append(member.name)
+        if not self.raid_mode and (self._welcome_task is None or self._welcome_task.done()):
+            self._welcome_task = self._loop.create_task(self._welcome_later()) # type: ignore
+
+    def update_raid_mode(self, now: Optional[float] = None) -> bool:
+        """Re-evaluates the join rate, entering or leaving raid mode.
+
+        Returns:
+            bool: Whether the pipeline is in raid mode
+        """
+        if now is None:
+            now = time.monotonic()
+        raid = len(self._joins) >= self.raid_threshold and now - self._joins[0] <= self.raid_window
+        if raid == self.raid_mode:
+            return raid
+        self.raid_mode = raid
+        if raid:
+            logger.warning("Join raid detected, %d joins within %.0fs", len(self._joins), self.raid_window)
+            if self._loop is not None and (self._raid_task is None or self._raid_task.done()):
+                self._raid_task = self._loop.create_task(self._watch_raid())
+        else:
+            logger.info("Join rate back to normal, leaving raid mode")
+            if self._loop is not None:
+                self._loop.create_task(self._end_raid())
+        return raid
+
+    async def close(self):
+        """Stops the workers and sends the pending welcome message."""
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+        for task in (self._welcome_task, self._raid_task):
+            if task is not None:
+                task.cancel()
+        self._welcome_task = None
+        self._raid_task = None
+        self._deferred = []
+        await self.send_welcome(force=True, summary=self.raid_mode)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "processed": self.processed,
+            "raid_mode": self.raid_mode,
+            "deferred": len(self._deferred),
+        }
+
+    async def send_welcome(self, force: bool = False, summary: bool = False):
+        """Sends the pending welcome, held back during a raid unless forced.
+
+        Args:
+            force (bool): Send even during a raid
+            summary (bool): Only state the number of joins, not the names
+        """
+        if self.raid_mode and not force:
+            return
+        names, count = self._welcome, self._welcome_count
+        self._welcome, self._welcome_count = [], 0
+        resolved = self.resolve()
+        if not count or resolved is None:
+            return
+        _, _, channel = resolved
+        if summary or count > _MAX_LISTED_NAMES:
+            text = f"Welcome to the server, {count} new members joined"
+        else:
+            text = f"Welcome to the server {', '.join(names)}"
+        try:
+            await channel.send(text, allowed_mentions=discord.AllowedMentions.none())
+        except discord.HTTPException as e:
+            logger.warning("Failed to send the welcome message: %s", e)
+
+    def _bind_loop(self):
+        # The cogs are loaded in a different event loop than the one the bot runs in
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._workers = []
+            self._welcome_task = None
+            self._raid_task = None
+        if not self._workers:
+            self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def _welcome_later(self):
+        await asyncio.sleep(self.welcome_window)
+        await self.send_welcome()
+
+    async def _watch_raid(self):
+        while self.raid_mode:
+            # The raid is over once the oldest of the last threshold joins leaves the window
+            delay = self._joins[0] + self.raid_window - time.monotonic()
+            await asyncio.sleep(max(delay, 0.0) + 0.1)
+            self.update_raid_mode()
+
+    async def _end_raid(self):
+        await self.send_welcome(summary=True)
+        deferred, self._deferred = self._deferred, []
+        for member in deferred:
+            try:
+                await self._moderate(member)
+            except Exception:
+                logger.exception("Failed to check the nickname of member %s", member.id)
+
+    async def _worker(self):
+        while True:
+            member: discord.Member = await self._queue.get() # type: ignore
+            try:
+                await self._process(member)
+            except Exception:
+                logger.exception("Failed to process the join of member %s", member.id)
+            finally:
+                self._queue.task_done() # type: ignore
+
+    async def _process(self, member: discord.Member):
+        if self.raid_mode:
+            # Checked in one go once the raid is over, the role can't wait
+            self._deferred.append(member)
+        else:
+            await self._moderate(member)
+        resolved = self.resolve()
+        if resolved is None:
+            return
+        _, role, _ = resolved
+        await member.add_roles(role)
+        self.processed += 1
@@ -0,0 +1,143 @@
+"""Banned word matcher shared by the automod and the moderation commands
+
+Building the matcher means reading the `automod_words` table, normalizing every
+configured word and compiling the matching engine. That is way too expensive to do
+per message, so the result is cached here and only rebuilt when the word list changes.
+
+The engine itself is pluggable, see `MATCHER_BACKENDS`. The default Aho-Corasick
+automaton scans in time linear in the text regardless of the number of words.
+
+Attributes:
+    matcher_cache (MatcherCache): The process wide matcher cache.
+"""
+import asyncio
+import re
+import threading
+from hashlib import blake2b
+from logging import Logger, getLogger
+from typing import Dict, List, Optional, Protocol
+
+from ..config.automod_config import BANNED_WORDS, MATCHER_BACKEND
+from ..database import get_session
+from ..database.database import db_executor
+from ..database.models.automod_words import AutomodWordsModel
+from .aho_corasick import AhoCorasick
+from .normalize import normalize
+
+logger: Logger = getLogger("Eternal.Events")
+
+
+def get_banned_words_from_db() -> List[str]:
+    banned_words: List[str] = []
+    with get_session() as session:
+        words = session.query(AutomodWordsModel).all()
+        banned_words = [word.word for word in words]
+    return banned_words
+
+
+class MatcherBackend(Protocol):
+    """A matching engine built from a list of normalized words."""
+
+    def search(self, text: str, whole_words: bool = True) -> bool: ...
+
+
+class RegexBackend:
+    """One alternation regex, its cost grows with the size of the word list."""
+
+    def __init__(self, words: List[str]):
+        alternation = "|".join(re.escape(word) for word in words)
+        self._words: Optional[re.Pattern] = None
+        self._substrings: Optional[re.Pattern] = None
+        if words:
+            # Build safe regex with word boundaries
+            self._words = re.compile(r"\b(" + alternation + r")\b")
+            self._substrings = re.compile(alternation)
+
+    def search(self, text: str, whole_words: bool = True) -> bool:
+        pattern = self._words if whole_words else self._substrings
+        if pattern is None:
+            return False
+        return bool(pattern.search(text))
+
+
+MATCHER_BACKENDS: Dict[str, type] = {
+    "aho-corasick": AhoCorasick,
+    "regex": RegexBackend,
+}
+
+
+class CompiledMatcher:
+    """An immutable snapshot of the banned word list and its compiled engine."""
+
+    def __init__(self, words: List[str], version: int, backend: str = MATCHER_BACKEND):
+        self.version = version
+        # Deduplicate while keeping the order, different variants normalize to the same word
+        self.words: List[str] = list(dict.fromkeys(word for word in words if word and not word.isspace()))
+        self.backend: MatcherBackend = MATCHER_BACKENDS[backend](self.words)
+        # Unlike the version this survives restarts, it only changes with the words
+        self.fingerprint: str = blake2b("\n".join(sorted(self.words)).encode(), digest_size=8).hexdigest()
+
+    def search(self, s: str, whole_words: bool = True) -> bool:
+        """Checks whether the already normalized string contains any banned words.
+
+        Args:
+            s (str): The normalized string, see `normalize`
+            whole_words (bool): Only match whole words, otherwise any substring matches
+        """
+        return self.backend.search(s, whole_words)
+
+
+class MatcherCache:
+    """Versioned cache of the compiled banned word matcher.
+
+    The version is bumped every time the matcher is rebuilt, so anything derived
+    from the word list can tell when it went stale.
+    """
+
+    def __init__(self):
+        if MATCHER_BACKEND not in MATCHER_BACKENDS:
+            raise RuntimeError(f"Unknown automod matcher backend: {MATCHER_BACKEND}")
+        self._matcher: Optional[CompiledMatcher] = None
+        self._version: int = 0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self) -> CompiledMatcher:
+        """Returns the current matcher, building it first if there is none yet.
+
+        Building reads the database, on the event loop `warm` has to run first.
+        """
+        matcher = self._matcher
+        if matcher is None:
+            matcher = self.reload()
+        return matcher
+
+    def reload(self) -> CompiledMatcher:
+        """Rebuilds the matcher from the config and the database."""
+        words = [normalize(i).strip() for i in BANNED_WORDS]
+        words.extend(normalize(i).strip() for i in get_banned_words_from_db())
+        with self._lock:
+            self._version += 1
+            matcher = CompiledMatcher(words, self._version)
+            self._matcher = matcher
+        logger.info(
+            "Built %s automod matcher v%d with %d words", MATCHER_BACKEND, matcher.version, len(matcher.words)
+        )
+        return matcher
+
+    async def reload_async(self) -> CompiledMatcher:
+        """Rebuilds the matcher on the database thread, keeping the event loop free."""
+        return await asyncio.get_running_loop().run_in_executor(db_executor, self.reload)
+
+    async def warm(self) -> CompiledMatcher:
+        """Builds the matcher on the database thread unless there already is one."""
+        matcher = self._matcher
+        if matcher is None:
+            matcher = await self.reload_async()
+        return matcher
+
+
+matcher_cache = MatcherCache()
@@ -0,0 +1,111 @@
+"""Text normalization for banned word matching
+
+Users dodge the automod with lookalike letters ("fаg" with a Cyrillic a), leetspeak
+("f4g"), accents and separators ("f a g", "!f!a!g!"). Instead of listing every variant
+by hand, both the banned words and the messages are folded to one canonical form.
+
+All character level folding is precomputed into a single `str.translate` table when
+the module is imported, so normalizing a message is one translate pass plus one
+precompiled regex that joins spaced out letters.
+
+Functions:
+    normalize: Folds a string to the canonical form used by the matcher.
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, Optional, Tuple
+
+# Lookalikes from other scripts that render (almost) like a latin letter
+CONFUSABLES: Dict[str, str] = {
+    # Cyrillic
+    "а": "a", "в": "b", "г": "r", "е": "e", "ё": "e", "з": "e", "и": "u", "к": "k", "м": "m",
+    "н": "h", "о": "o", "п": "n", "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "ь": "b",
+    "ѕ": "s", "і": "i", "ї": "i", "ј": "j", "ԁ": "d", "ԛ": "q", "ԝ": "w", "ү": "y", "һ": "h",
+    "А": "a", "В": "b", "Е": "e", "Ё": "e", "З": "e", "К": "k", "М": "m", "Н": "h", "О": "o",
+    "Р": "p", "С": "c", "Т": "t", "У": "y", "Х": "x", "Ѕ": "s", "І": "i", "Ј": "j", "Ү": "y",
+    "Һ": "h",
+    # Greek
+    "α": "a", "β": "b", "γ": "y", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o",
+    "ρ": "p", "τ": "t", "υ": "u", "χ": "x", "ω": "w", "Α": "a", "Β": "b", "Ε": "e", "Ζ": "z",
+    "Η": "h", "Ι": "i", "Κ": "k", "Μ": "m", "Ν": "n", "Ο": "o", "Ρ": "p", "Τ": "t", "Υ": "y",
+    "Χ": "x",
+    # Latin lookalikes without a decomposition
+    "ı": "i", "ł": "l", "ø": "o", "đ": "d", "ħ": "h", "ŧ": "t", "ƒ": "f", "ɡ": "g", "ß": "ss",
+}
+
+# Digits and symbols commonly used in place of letters
+LEETSPEAK: Dict[str, str] = {
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "9": "g",
+    "@": "a", "$": "s", "€": "e", "£": "l",
+}
+
+# Characters people wedge between letters, these are dropped entirely. Punctuation
+# that also separates real words (".", "-", "'") becomes a space instead, so it never
+# glues two words together, "f.a.g" is still joined like any spaced out letters
+SEPARATORS: str = "!*_~^`\"|+#\u00ad\u200b\u200c\u200d\u2060\ufeff"
+
+# The ranges the translate table is precomputed for, everything else passes through
+_TABLE_RANGES: Tuple[Tuple[int, int], ...] = (
+    (0x0000, 0x0530),  # Latin, IPA, combining marks, Greek, Cyrillic
+    (0x1D00, 0x1DBF),  # Phonetic extensions (small caps)
+    (0x1E00, 0x1EFF),  # Latin extended additional
+    (0x2000, 0x206F),  # General punctuation, zero width characters
+    (0x20A0, 0x20CF),  # Currency symbols
+    (0xFF00, 0xFFEF),  # Fullwidth forms
+)
+
+
+def _fold_char(c: str) -> Optional[str]:
+    """Maps one character to its canonical form, None means drop it."""
+    if c in SEPARATORS:
+        return None
+    if c in CONFUSABLES:
+        return CONFUSABLES[c]
+    if c in LEETSPEAK:
+        return LEETSPEAK[c]
+    category = unicodedata.category(c)
+    if category == "Mn" or category == "Cf":
+        # Combining accents and invisible formatting
+        return None
+    if c.isspace() or category.startswith(("P", "S")):
+        return " "
+    decomposed = "".join(
+        d for d in unicodedata.normalize("NFKD", c) if not unicodedata.combining(d)
+    )
+    if decomposed and decomposed != c:
+        # Accented and fullwidth letters, folded again so "！" becomes a separator
+        folded = (_fold_char(d) for d in decomposed)
+        return "".join(f for f in folded if f is not None)
+    return c.lower()
+
+
+def _build_table(ranges: Iterable[Tuple[int, int]]) -> Dict[int, Optional[str]]:
+    table: Dict[int, Optional[str]] = {}
+    for start, end in ranges:
+        for codepoint in range(start, end):
+            c = chr(codepoint)
+            folded = _fold_char(c)
+            if folded != c:
+                table[codepoint] = folded
+    return table
+
+
+TRANSLATE_TABLE: Dict[int, Optional[str]] = _build_table(_TABLE_RANGES)
+
+# Runs of single letters split by whitespace, "f a g" -> "fag"
+_SPACED_LETTERS = re.compile(r"(?<!\w)\w(?:\s+\w(?!\w))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _join_letters(match: re.Match) -> str:
+    return _WHITESPACE.sub("", match.group())
+
+
+def normalize(s: str) -> str:
+    """Folds a string to the canonical form used by the matcher.
+
+    Lowercases it, folds lookalike letters, accents and leetspeak, drops separators
+    and joins spaced out letters. The same function is applied to the banned words
+    and the checked text, so both sides always agree.
+    """
+    return _SPACED_LETTERS.sub(_join_letters, s.translate(TRANSLATE_TABLE))
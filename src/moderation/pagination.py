@@ -0,0 +1,118 @@
+"""Button-driven paging through keyset-paginated queries
+
+Pages are fetched lazily, one at a time, with `fetch(after, limit)` returning the rows
+that come after the key `after` (or the first rows when it's None). Only the page
+that's shown is rendered, plus the key each visited page starts after so the previous
+button can go back. The last few fetched pages are kept for `PAGE_CACHE_TTL` seconds,
+flipping back and forth between them doesn't query again.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, List, Optional, Tuple, TypeVar
+
+import discord
+
+R = TypeVar("R")
+
+Fetch = Callable[[Optional[Any], int], Awaitable[List[R]]]
+Render = Callable[[List[R], int, bool], discord.Embed]
+
+# How long and how many fetched pages are kept per view
+PAGE_CACHE_TTL = 30.0
+PAGE_CACHE_SIZE = 3
+
+
+class KeysetPaginator(discord.ui.View, Generic[R]):
+    """Previous and next buttons over a keyset-paginated query.
+
+    Args:
+        fetch: Returns up to `limit` rows after the given key
+        key: The keyset key of a row, e.g. `(row.time, row.id)`
+        render: Builds the embed of a page from its rows, its index and whether it's the last one
+        author_id: The only user allowed to flip the pages
+    """
+
+    def __init__(
+        self,
+        fetch: Fetch,
+        key: Callable[[R], Any],
+        render: Render,
+        author_id: int,
+        page_size: int = 10,
+        timeout: float = 180,
+    ):
+        super().__init__(timeout=timeout)
+        self._fetch = fetch
+        self._key = key
+        self._render = render
+        self.author_id = author_id
+        self.page_size = page_size
+        # Key each visited page starts after, the last one is the current page
+        self._starts: List[Optional[Any]] = [None]
+        self._rows: List[R] = []
+        self._has_next = False
+        self._interaction: Optional[discord.Interaction] = None
+        # start key -> (fetched at, rows including the look-ahead row)
+        self._cache: "OrderedDict[Any, Tuple[float, List[R]]]" = OrderedDict()
+
+    @property
+    def page(self) -> int:
+        return len(self._starts) - 1
+
+    async def start(self, interaction: discord.Interaction, ephemeral: bool = True):
+        """Fetches the first page and sends it as the response to the interaction."""
+        self._interaction = interaction
+        await self._load()
+        await interaction.response.send_message(embed=self._embed(), view=self, ephemeral=ephemeral)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("These pages belong to someone else.", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self._interaction is None:
+            return
+        try:
+            await self._interaction.edit_original_response(view=None)
+        except discord.HTTPException:
+            pass
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self._starts) > 1:
+            self._starts.pop()
+        await self._load()
+        await interaction.response.edit_message(embed=self._embed(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self._has_next and self._rows:
+            self._starts.append(self._key(self._rows[-1]))
+        await self._load()
+        await interaction.response.edit_message(embed=self._embed(), view=self)
+
+    async def _load(self):
+        rows = await self._cached_fetch(self._starts[-1])
+        self._has_next = len(rows) > self.page_size
+        self._rows = rows[:self.page_size]
+        self.previous.disabled = self.page == 0
+        self.next.disabled = not self._has_next
+
+    async def _cached_fetch(self, start: Optional[Any]) -> List[R]:
+        now = time.monotonic()
+        cached = self._cache.get(start)
+        if cached is not None and now - cached[0] <= PAGE_CACHE_TTL:
+            self._cache.move_to_end(start)
+            return cached[1]
+        # One extra row tells whether there is a next page without counting
+        rows = await self._fetch(start, self.page_size + 1)
+        self._cache[start] = (now, rows)
+        self._cache.move_to_end(start)
+        while len(self._cache) > PAGE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return rows
+
+    def _embed(self) -> discord.Embed:
+        return self._render(self._rows, self.page, not self._has_next)
@@ -0,0 +1,171 @@
+"""Background nickname sweep over the members already in the guild
+
+`moderate_nickname` only sees members when they join or change their nickname, so
+words added later never reach the existing members. The sweep walks the member list
+in ID order, `SWEEP_CHUNK_SIZE` members at a time, and checks each chunk against the
+current matcher. Renames go through a single paced worker so the sweep can't eat the
+rate limits the rest of the bot needs.
+
+Progress is checkpointed to a JSON file after every chunk. The checkpoint is tied to
+the matcher fingerprint, a restart with the same word list resumes where it stopped
+and a changed word list starts over.
+"""
+import asyncio
+import json
+import os
+import time
+from logging import Logger, getLogger
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import discord
+
+from ..config.automod_config import SWEEP_CHUNK_SIZE, SWEEP_EDIT_INTERVAL
+from .matcher import matcher_cache
+from .normalize import normalize
+
+logger: Logger = getLogger("Eternal.Events")
+
+
+class NicknameSweep:
+    """Resumable scan of every member's display name.
+
+    Attributes:
+        scanned (int): Members checked during the current run
+        renamed (int): Members renamed during the current run
+        rate (float): Members scanned per second during the current run
+    """
+
+    def __init__(
+        self,
+        store_path: str,
+        rename: Callable[[discord.Member], Awaitable[None]],
+        chunk_size: int = SWEEP_CHUNK_SIZE,
+        edit_interval: float = SWEEP_EDIT_INTERVAL,
+    ):
+        self._store_path = store_path
+        self._rename = rename
+        self.chunk_size = chunk_size
+        self.edit_interval = edit_interval
+        self._task: Optional[asyncio.Task] = None
+        self.scanned = 0
+        self.renamed = 0
+        self.rate = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, guild: discord.Guild):
+        """Starts the sweep, restarting it if one is already running."""
+        if self.running:
+            self._task.cancel() # type: ignore
+        self._task = asyncio.get_running_loop().create_task(self._run(guild))
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel() # type: ignore
+            try:
+                await self._task # type: ignore
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self.running,
+            "scanned": self.scanned,
+            "renamed": self.renamed,
+            "rate": self.rate,
+        }
+
+    # Persistence
+    def _load_checkpoint(self) -> Dict:
+        try:
+            if os.path.exists(self._store_path):
+                with open(self._store_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception:
+            logger.exception("Failed loading the nickname sweep checkpoint")
+        return {}
+
+    def _save_checkpoint(self, checkpoint: Dict):
+        try:
+            with open(self._store_path, "w", encoding="utf-8") as f:
+                json.dump(checkpoint, f, indent=2)
+        except Exception:
+            logger.exception("Failed saving the nickname sweep checkpoint")
+
+    # Sweep
+    async def _run(self, guild: discord.Guild):
+        matcher = matcher_cache.get()
+        checkpoint = self._load_checkpoint()
+        if checkpoint.get("guild") != guild.id or checkpoint.get("fingerprint") != matcher.fingerprint:
+            checkpoint = {"guild": guild.id, "fingerprint": matcher.fingerprint, "last_member": 0, "done": False}
+        if checkpoint["done"]:
+            logger.info("Nickname sweep already finished for the current word list")
+            return
+
+        if not guild.chunked:
+            await guild.chunk()
+        members = sorted(
+            (m for m in guild.members if m.id > checkpoint["last_member"] and not m.bot),
+            key=lambda m: m.id,
+        )
+        logger.info(
+            "Starting nickname sweep of %d members%s",
+            len(members), " (resumed)" if checkpoint["last_member"] else "",
+        )
+
+        queue: asyncio.Queue = asyncio.Queue()
+        worker = asyncio.get_running_loop().create_task(self._edit_worker(queue))
+        self.scanned = 0
+        self.renamed = 0
+        start = time.perf_counter()
+        try:
+            for i in range(0, len(members), self.chunk_size):
+                chunk = members[i:i + self.chunk_size]
+                for member in self._match_chunk(chunk):
+                    queue.put_nowait(member)
+                # Only checkpoint once the renames of the chunk went through
+                await queue.join()
+                self.scanned += len(chunk)
+                self.rate = self.scanned / max(time.perf_counter() - start, 1e-9)
+                checkpoint["last_member"] = chunk[-1].id
+                self._save_checkpoint(checkpoint)
+                logger.debug("Nickname sweep: %d/%d members, %.0f members/s", self.scanned, len(members), self.rate)
+        finally:
+            worker.cancel()
+
+        checkpoint["done"] = True
+        self._save_checkpoint(checkpoint)
+        logger.info(
+            "Nickname sweep finished: %d members scanned, %d renamed, %.0f members/s",
+            self.scanned, self.renamed, self.rate,
+        )
+
+    def _match_chunk(self, chunk: List[discord.Member]) -> List[discord.Member]:
+        matcher = matcher_cache.get()
+        # Straight to the matcher, every name is checked once and would only push the
+        # message verdicts out of the shared verdict cache
+        return [
+            member for member in chunk
+            if matcher.search(normalize(member.display_name), whole_words=False)
+        ]
+
+    async def _edit_worker(self, queue: asyncio.Queue):
+        while True:
+            member: discord.Member = await queue.get()
+            try:
+                await self._rename(member)
+                self.renamed += 1
+            except discord.Forbidden:
+                logger.warning("Missing permissions to rename member %s", member.id)
+            except discord.HTTPException as e:
+                logger.warning("Failed to rename member %s: %s", member.id, e)
+            except Exception:
+                # The sweep waits on the queue, the worker must outlive any failure
+                logger.exception("Failed to rename member %s", member.id)
+            finally:
+                queue.task_done()
+            # Pace the renames, discord.py only backs off once we already hit the limit
+            await asyncio.sleep(self.edit_interval)
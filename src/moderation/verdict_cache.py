@@ -0,0 +1,73 @@
+"""LRU cache of automod verdicts
+
+Spam waves repeat the same text over and over and nickname updates keep re-checking
+the same names. The verdict for a normalized text only depends on the word list, so
+it's remembered here until the matcher version changes.
+
+Attributes:
+    verdict_cache (VerdictCache): The cache shared by the automod checks.
+"""
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Dict, Optional
+
+from ..config.automod_config import VERDICT_CACHE_SIZE
+from .matcher import CompiledMatcher
+
+
+class VerdictCache:
+    """Bounded LRU mapping of normalized content hashes to verdicts.
+
+    Attributes:
+        hits (int): Lookups answered from the cache
+        misses (int): Lookups that had to run the matcher
+    """
+
+    def __init__(self, max_size: int = VERDICT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, bool]" = OrderedDict()
+        self._version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def check(self, normalized: str, matcher: CompiledMatcher, whole_words: bool = True) -> bool:
+        """Returns the matcher's verdict for the normalized text, cached.
+
+        Args:
+            normalized (str): The normalized text, see `normalize`
+            matcher (CompiledMatcher): The current matcher
+            whole_words (bool): Passed to `CompiledMatcher.search`
+        """
+        if matcher.version != self._version:
+            # The word list changed, every verdict may be wrong now
+            self._entries.clear()
+            self._version = matcher.version
+
+        key = blake2b(normalized.encode(), digest_size=16, person=b"w" if whole_words else b"s").digest()
+        verdict = self._entries.get(key)
+        if verdict is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return verdict
+
+        self.misses += 1
+        verdict = matcher.search(normalized, whole_words)
+        self._entries[key] = verdict
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return verdict
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+verdict_cache = VerdictCache()
@@ -0,0 +1,2 @@
+"""Transcript rendering and export helpers used by the Transcript cog"""
+from .writer import TranscriptReport, TranscriptWriter, write_transcript
@@ -0,0 +1,162 @@
+"""Incremental transcripts backed by an on-disk checkpoint
+
+Every channel exported incrementally gets a directory with two files:
+
+    fragments.html   the rendered messages so far, oldest first, without header or footer
+    state.json       the last message in the fragments, how many there are and the size
+                     of the fragments file up to that message
+
+A new export only fetches the messages after the last one with `after=`, appends their
+fragments and copies the whole file into a fresh transcript, nothing is downloaded or
+rendered twice. The state is saved every `TRANSCRIPT_CHECKPOINT_EVERY` messages, after
+the fragments are flushed to disk, and when the export stops. Both fsyncs run on a
+worker thread, not on the event loop. If the bot dies midway,
+the next export cuts the fragments back to the saved size and carries on from the
+saved message.
+
+Messages that were edited or deleted after they were exported keep their old fragment,
+delete the channel's directory to start over. The fragments are also thrown away when
+`MESSAGE_TEMPLATE` or `markup.MARKUP_VERSION` changes, they would no longer match the
+rest of the transcript.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from logging import Logger, getLogger
+from typing import Optional
+
+import discord
+
+from ..config.transcript_config import TRANSCRIPT_CHECKPOINT_EVERY
+from .markup import MARKUP_VERSION
+from .writer import MESSAGE_TEMPLATE, WRITE_BUFFER, Progress, Render, TranscriptReport, TranscriptWriter
+
+transcript_logger: Logger = getLogger("Eternal.Transcripts")
+
+FRAGMENTS = "fragments.html"
+STATE = "state.json"
+
+# Fragments rendered with another template or markup are stale
+TEMPLATE_HASH = hashlib.sha256(f"{MARKUP_VERSION}\n{MESSAGE_TEMPLATE}".encode("utf-8")).hexdigest()[:16]
+
+
+class TranscriptCheckpoint:
+    """The rendered messages of one channel and how far they go.
+
+    Attributes:
+        last_id (Optional[int]): ID of the newest message in the fragments
+        messages (int): Messages in the fragments
+    """
+
+    def __init__(self, directory: str, every: int = TRANSCRIPT_CHECKPOINT_EVERY):
+        self.directory = directory
+        self.every = every
+        self.fragments_path = os.path.join(directory, FRAGMENTS)
+        self.state_path = os.path.join(directory, STATE)
+        self.last_id: Optional[int] = None
+        self.messages = 0
+        self._size = 0
+        self._pending = 0
+        self._file = None
+
+    def open(self):
+        """Loads the saved state and drops whatever was written after it."""
+        os.makedirs(self.directory, exist_ok=True)
+        state = self._load_state()
+        if state.get("template") == TEMPLATE_HASH:
+            self.last_id = state.get("last_id")
+            self.messages = state.get("messages", 0)
+            self._size = state.get("size", 0)
+        elif state:
+            transcript_logger.info("Discarding the stale transcript checkpoint in %s", self.directory)
+
+        # Opening for append creates the file, truncating cuts off a crashed export
+        self._file = open(self.fragments_path, "a", encoding="utf-8", buffering=WRITE_BUFFER)
+        if os.path.getsize(self.fragments_path) != self._size:
+            self._file.truncate(self._size)
+
+    async def add(self, message: discord.Message, fragment: str):
+        self._file.write(fragment) # type: ignore
+        self.last_id = message.id
+        self.messages += 1
+        self._pending += 1
+        if self._pending >= self.every:
+            await asyncio.to_thread(self.save)
+
+    def save(self):
+        """Saves the state, once the fragments it points to are on disk."""
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._pending = 0
+        state = {"template": TEMPLATE_HASH, "last_id": self.last_id, "messages": self.messages, "size": self._size}
+        temporary = self.state_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        # Either the old or the new state survives a crash, never half of one
+        os.replace(temporary, self.state_path)
+
+    def close(self):
+        if self._file is not None:
+            self.save()
+            self._file.close()
+            self._file = None
+
+    def _load_state(self) -> dict:
+        try:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception:
+            transcript_logger.exception("Failed loading the transcript checkpoint in %s", self.directory)
+        return {}
+
+
+async def write_incremental_transcript(
+    source: discord.abc.Messageable,
+    checkpoint_dir: str,
+    path: str,
+    name: str,
+    render: Render,
+    intro: Optional[str] = None,
+    progress: Optional[Progress] = None,
+) -> TranscriptReport:
+    """Brings the checkpoint in `checkpoint_dir` up to date and writes the transcript from it.
+
+    The report counts the messages fetched by this export, the transcript holds all of them.
+    """
+    start = time.perf_counter()
+    checkpoint = TranscriptCheckpoint(checkpoint_dir)
+    checkpoint.open()
+    resumed_from = checkpoint.messages
+    try:
+        after = discord.Object(id=checkpoint.last_id) if checkpoint.last_id is not None else None
+        async for message in source.history(limit=None, after=after, oldest_first=True):
+            await checkpoint.add(message, render(message))
+            if progress is not None:
+                progress(1)
+    finally:
+        # A failed or cancelled export still keeps what it rendered for the next one
+        await asyncio.to_thread(checkpoint.close)
+
+    writer = TranscriptWriter(path, render)
+    try:
+        await writer.write_header(name, intro)
+        with open(checkpoint.fragments_path, "r", encoding="utf-8") as fragments:
+            writer.write_fragments(fragments, checkpoint.messages)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+    report = TranscriptReport(name, path, checkpoint.messages - resumed_from, time.perf_counter() - start)
+    transcript_logger.info(
+        "Incremental transcript of %s, %d messages from the checkpoint", report.describe(), resumed_from
+    )
+    return report
@@ -0,0 +1,321 @@
+"""Background transcript jobs
+
+Transcript commands only queue a job and answer right away, the export runs in the
+background where it can take as long as it needs. Every guild has its own queue,
+drained by `TRANSCRIPT_GUILD_WORKERS` workers, and no more than
+`TRANSCRIPT_JOB_CONCURRENCY` jobs run at the same time over all guilds. A request
+for a transcript that is already queued or running joins that job instead of
+starting another one, everyone who asked for it gets the files.
+
+Each job writes into its own directory under the queue's output directory, so jobs
+over overlapping channels never write the same file, the directory is removed once
+the job is over. Progress is shown by editing a single status message in the
+requester's DMs every `TRANSCRIPT_PROGRESS_INTERVAL` seconds. DMs don't expire like
+interaction followups do, so even exports that take hours can be followed.
+"""
+import asyncio
+import itertools
+import os
+import shutil
+import time
+from collections import deque
+from logging import Logger, getLogger
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import discord
+
+from ..config.transcript_config import (
+    TRANSCRIPT_GUILD_WORKERS,
+    TRANSCRIPT_JOB_CONCURRENCY,
+    TRANSCRIPT_PROGRESS_INTERVAL,
+)
+from .writer import TranscriptReport
+
+transcript_logger: Logger = getLogger("Eternal.Transcripts")
+
+# (guild id, kind, channel id), requests with the same key share a job
+JobKey = Tuple[int, str, int]
+
+_job_ids = itertools.count(1)
+
+
+class TranscriptJob:
+    """One queued or running export.
+
+    Attributes:
+        state (str): "queued", "running", "finished", "failed" or "cancelled"
+        messages (int): Messages written so far
+    """
+
+    def __init__(
+        self,
+        guild_id: int,
+        kind: str,
+        channel_id: int,
+        label: str,
+        requester: discord.abc.User,
+        run: Callable[["TranscriptJob"], Awaitable[List[TranscriptReport]]],
+    ):
+        """
+        Args:
+            run: Writes the transcripts into `job.out_dir`, reporting progress with `job.advance`
+        """
+        # Assigned once the job is queued
+        self.id = 0
+        self.key: JobKey = (guild_id, kind, channel_id)
+        self.guild_id = guild_id
+        self.label = label
+        self.requester = requester
+        self.subscribers: List[discord.abc.User] = [requester]
+        self.status_message: Optional[discord.Message] = None
+        self.out_dir = ""
+        self._run = run
+        self.state = "queued"
+        self.messages = 0
+        self.reports: List[TranscriptReport] = []
+        self.queued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def advance(self, messages: int):
+        self.messages += messages
+
+    @property
+    def waited(self) -> float:
+        return (self.started_at or self.finished_at or time.monotonic()) - self.queued_at
+
+    @property
+    def ran(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def describe(self) -> str:
+        rate = self.messages / max(self.ran, 1e-9)
+        if self.state == "queued":
+            return f"Transcript job #{self.id} of {self.label} is queued."
+        if self.state == "running":
+            return (
+                f"Transcript job #{self.id} of {self.label} is running: "
+                f"{self.messages} messages in {self.ran:.0f} s ({rate:.0f} messages/s)."
+            )
+        return (
+            f"Transcript job #{self.id} of {self.label} {self.state}: {self.messages} messages, "
+            f"waited {self.waited:.1f} s, ran {self.ran:.1f} s ({rate:.0f} messages/s)."
+        )
+
+
+class TranscriptJobQueue:
+    """Per-guild job queues with a global concurrency cap.
+
+    Attributes:
+        completed (int): Jobs that finished
+        failed (int): Jobs that raised
+        cancelled (int): Jobs cancelled while queued or running
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        concurrency: int = TRANSCRIPT_JOB_CONCURRENCY,
+        guild_workers: int = TRANSCRIPT_GUILD_WORKERS,
+        progress_interval: float = TRANSCRIPT_PROGRESS_INTERVAL,
+    ):
+        self.out_dir = out_dir
+        self.concurrency = concurrency
+        self.guild_workers = guild_workers
+        self.progress_interval = progress_interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: List[asyncio.Task] = []
+        # Jobs that are queued or running
+        self._jobs: Dict[int, TranscriptJob] = {}
+        self._by_key: Dict[JobKey, TranscriptJob] = {}
+        self.durations: Deque[float] = deque(maxlen=100)
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # The cogs are loaded in a different event loop than the one the bot runs in
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._queues = {}
+            self._workers = []
+
+    def submit(self, job: TranscriptJob) -> TranscriptJob:
+        """Queues the job, or adds its requester to an identical one already in flight.
+
+        Returns:
+            TranscriptJob: The job that will produce the transcript
+        """
+        self._bind_loop()
+        existing = self._by_key.get(job.key)
+        if existing is not None:
+            if all(user.id != job.requester.id for user in existing.subscribers):
+                existing.subscribers.append(job.requester)
+            return existing
+
+        job.id = next(_job_ids)
+        self._jobs[job.id] = job
+        self._by_key[job.key] = job
+        queue = self._queues.get(job.guild_id)
+        if queue is None:
+            queue = self._queues[job.guild_id] = asyncio.Queue()
+            for _ in range(self.guild_workers):
+                self._workers.append(asyncio.get_running_loop().create_task(self._worker(queue)))
+        queue.put_nowait(job)
+        transcript_logger.info("Queued transcript job #%d of %s", job.id, job.label)
+        return job
+
+    def get(self, job_id: int) -> Optional[TranscriptJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self, guild_id: int) -> List[TranscriptJob]:
+        return [job for job in self._jobs.values() if job.guild_id == guild_id]
+
+    def unsubscribe(self, job: TranscriptJob, user: discord.abc.User) -> bool:
+        """Stops sending the job's transcript to the user, cancelling the job once nobody wants it.
+
+        Returns:
+            bool: Whether the job was cancelled
+        """
+        job.subscribers = [subscriber for subscriber in job.subscribers if subscriber.id != user.id]
+        if job.subscribers:
+            return False
+        return self.cancel(job)
+
+    def cancel(self, job: TranscriptJob) -> bool:
+        """Cancels a queued or running job, returns whether there was anything to cancel."""
+        if job.state == "queued":
+            # The worker drops it once it's dequeued
+            self._finish(job, "cancelled")
+            asyncio.get_running_loop().create_task(self._edit_status(job))
+            return True
+        if job.state == "running" and job.task is not None:
+            job.task.cancel()
+            return True
+        return False
+
+    async def close(self):
+        for job in list(self._jobs.values()):
+            self.cancel(job)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues = {}
+
+    def stats(self) -> Dict[str, float]:
+        running = sum(1 for job in self._jobs.values() if job.state == "running")
+        return {
+            "queued": len(self._jobs) - running,
+            "running": running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "avg_duration": sum(self.durations) / len(self.durations) if self.durations else 0.0,
+            "max_duration": max(self.durations, default=0.0),
+        }
+
+    # Workers
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job: TranscriptJob = await queue.get()
+            try:
+                if job.state != "queued":
+                    continue
+                async with self._slots: # type: ignore
+                    # Could have been cancelled while waiting for a slot
+                    if job.state == "queued":
+                        await self._execute(job)
+            except Exception:
+                transcript_logger.exception("Transcript job #%d crashed", job.id)
+            finally:
+                queue.task_done()
+
+    async def _execute(self, job: TranscriptJob):
+        job.state = "running"
+        job.started_at = time.monotonic()
+        job.out_dir = os.path.join(self.out_dir, f"job-{job.id}")
+        os.makedirs(job.out_dir, exist_ok=True)
+        job.task = asyncio.get_running_loop().create_task(job._run(job))
+        progress = asyncio.get_running_loop().create_task(self._report_progress(job))
+        try:
+            # `wait` instead of awaiting the task, so cancelling the job doesn't cancel the worker
+            await asyncio.wait([job.task])
+        except asyncio.CancelledError:
+            # The queue is closing
+            job.task.cancel()
+            self._finish(job, "cancelled")
+            shutil.rmtree(job.out_dir, ignore_errors=True)
+            raise
+        finally:
+            progress.cancel()
+
+        try:
+            if job.task.cancelled():
+                self._finish(job, "cancelled")
+            elif job.task.exception() is not None:
+                transcript_logger.error("Transcript job #%d failed", job.id, exc_info=job.task.exception())
+                self._finish(job, "failed")
+            else:
+                job.reports = job.task.result()
+                self._finish(job, "finished")
+                await self._deliver(job)
+        finally:
+            shutil.rmtree(job.out_dir, ignore_errors=True)
+        await self._edit_status(job)
+
+    def _finish(self, job: TranscriptJob, state: str):
+        job.state = state
+        job.finished_at = time.monotonic()
+        self._jobs.pop(job.id, None)
+        if self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+        if state == "finished":
+            self.completed += 1
+            self.durations.append(job.ran)
+        elif state == "failed":
+            self.failed += 1
+        else:
+            self.cancelled += 1
+        transcript_logger.info("%s", job.describe())
+
+    async def _report_progress(self, job: TranscriptJob):
+        last = -1
+        while True:
+            if job.messages != last:
+                last = job.messages
+                await self._edit_status(job)
+            await asyncio.sleep(self.progress_interval)
+
+    async def _edit_status(self, job: TranscriptJob):
+        if job.status_message is None:
+            return
+        try:
+            await job.status_message.edit(content=job.describe())
+        except discord.HTTPException as e:
+            transcript_logger.debug("Failed to update the status of transcript job #%d: %s", job.id, e)
+
+    async def _deliver(self, job: TranscriptJob):
+        for user in job.subscribers:
+            for report in job.reports:
+                try:
+                    await user.send(file=discord.File(report.path))
+                except discord.Forbidden as e:
+                    transcript_logger.warning("Failed to send transcript job #%d to %s: %s", job.id, user.id, e)
+                    # Their DMs are closed, the other files won't get through either
+                    break
+                except (discord.HTTPException, OSError) as e:
+                    # e.g. a file over the upload limit, the others may still fit
+                    transcript_logger.warning(
+                        "Failed to send %s of transcript job #%d to %s: %s", report.name, job.id, user.id, e
+                    )
+                except Exception:
+                    transcript_logger.exception("Failed to send transcript job #%d to %s", job.id, user.id)
+                    break
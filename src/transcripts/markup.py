@@ -0,0 +1,69 @@
+"""Single pass message markup compiler for transcripts
+
+Message content is turned into HTML by one precompiled regular expression whose
+alternatives are the tokens that need rewriting:
+
+    code blocks      ```...``` become <pre>, with their ANSI sequences stripped
+    ANSI sequences   removed
+    custom emoji     <:name:id> and animated <a:name:id> become <img> tags
+    mentions         @everyone, @here and ID mentions get a zero width space, nothing pings
+    newlines         \\r\\n, \\r and \\n become <br>
+    &, < and >       escaped, message content can't inject markup into the transcript
+
+Everything in between is copied as is, so a message is compiled in time linear in
+its length.
+"""
+import re
+from typing import Match
+
+# Bump whenever a message renders to different HTML, here or in the Transcript cog's
+# attachment markup. Incremental transcripts throw away fragments of another version
+MARKUP_VERSION = 1
+
+EMOJI_URL = "https://cdn.discordapp.com/emojis/{id}.{ext}?size=128&quality=lossless"
+EMOJI_SIZE = 24
+
+_ANSI = r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])"
+_ANSI_PATTERN = re.compile(_ANSI)
+_ESCAPES = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
+_ESCAPE_PATTERN = re.compile(r"[&<>]")
+
+_TOKENS = re.compile(
+    r"(?P<code>```(?P<code_body>[\s\S]*?)```)"
+    r"|(?P<emoji><(?P<animated>a?):(?P<name>\w{2,32}):(?P<id>\d{15,21})>)"
+    rf"|(?P<ansi>{_ANSI})"
+    r"|(?P<mention>@)(?=everyone|here|[!&]?\d{17,20})"
+    r"|(?P<newline>\r\n|\r|\n)"
+    r"|(?P<escape>[&<>])"
+)
+
+
+def _escape(text: str) -> str:
+    return _ESCAPE_PATTERN.sub(lambda m: _ESCAPES[m.group()], text)
+
+
+def _token(match: Match[str]) -> str:
+    kind = match.lastgroup
+    if kind == "escape":
+        return _ESCAPES[match.group()]
+    if kind == "newline":
+        return "<br>"
+    if kind == "mention":
+        return "@\u200b"
+    if kind == "ansi":
+        return ""
+    if kind == "emoji":
+        url = EMOJI_URL.format(id=match.group("id"), ext="gif" if match.group("animated") else "webp")
+        return (
+            f'<img class="emoji" src="{_escape(url)}" alt=":{match.group("name")}:" '
+            f'width="{EMOJI_SIZE}" height="{EMOJI_SIZE}" />'
+        )
+    # Code block, kept verbatim apart from the escaping
+    return f"<pre>{_escape(_ANSI_PATTERN.sub('', match.group('code_body')))}</pre>"
+
+
+def render_markup(text: str) -> str:
+    """Compiles the content of a message into transcript HTML."""
+    if not text:
+        return ""
+    return _TOKENS.sub(_token, text)
@@ -0,0 +1,91 @@
+"""Concurrent transcript export of every thread in a channel
+
+Active threads come from the cache, archived ones (public, and private when the bot
+may see them) are paged over REST. Each thread gets its own task, but only
+`TRANSCRIPT_THREAD_CONCURRENCY` histories are fetched at the same time across every
+running export, which keeps the bot well inside Discord's rate limits; discord.py
+still backs off on its own if one is hit. Reports come back ordered by thread ID,
+whichever thread finished first.
+"""
+import asyncio
+import os
+from logging import Logger, getLogger
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+import discord
+
+from ..config.transcript_config import TRANSCRIPT_THREAD_CONCURRENCY
+from .writer import Progress, Render, TranscriptReport, transcript_filename, write_transcript
+
+transcript_logger: Logger = getLogger("Eternal.Transcripts")
+
+ThreadParent = Union[discord.TextChannel, discord.ForumChannel]
+
+_export_slots: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+
+def _slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _export_slots.get(loop)
+    if slots is None:
+        # The cogs are loaded in a different event loop than the one the bot runs in
+        _export_slots.clear()
+        slots = _export_slots[loop] = asyncio.Semaphore(TRANSCRIPT_THREAD_CONCURRENCY)
+    return slots
+
+
+async def iter_threads(channel: ThreadParent) -> AsyncIterator[discord.Thread]:
+    """Active and archived threads of the channel, each once."""
+    seen = set()
+    for thread in channel.threads:
+        seen.add(thread.id)
+        yield thread
+    archives = [channel.archived_threads(limit=None)]
+    if isinstance(channel, discord.TextChannel):
+        # Forum posts are always public
+        archives.append(channel.archived_threads(limit=None, private=True))
+    for index, archive in enumerate(archives):
+        try:
+            async for thread in archive:
+                if thread.id not in seen:
+                    seen.add(thread.id)
+                    yield thread
+        except discord.Forbidden:
+            # Private archived threads need Manage Threads, the public ones are still exported
+            if index == 0:
+                raise
+            transcript_logger.info("Skipping private archived threads of %s, missing permissions", channel.id)
+
+
+async def export_threads(
+    channel: ThreadParent,
+    out_dir: str,
+    render: Render,
+    progress: Optional[Progress] = None,
+) -> List[TranscriptReport]:
+    """Writes a transcript of every thread of the channel into `out_dir`.
+
+    Threads that fail to export are logged and left out of the result.
+    """
+    async def export(thread: discord.Thread) -> Optional[TranscriptReport]:
+        path = os.path.join(out_dir, transcript_filename(thread))
+        async with _slots():
+            try:
+                return await write_transcript(
+                    thread, path, thread.name, render,
+                    intro=f"<div>Thread ID: {thread.id}, Name: {thread.name}</div>",
+                    progress=progress,
+                )
+            except discord.HTTPException as e:
+                transcript_logger.warning("Failed to export thread %s: %s", thread.id, e)
+                return None
+
+    threads = sorted([thread async for thread in iter_threads(channel)], key=lambda thread: thread.id)
+    tasks = [asyncio.ensure_future(export(thread)) for thread in threads]
+    try:
+        reports = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return [report for report in reports if report is not None]
@@ -0,0 +1,127 @@
+"""Streaming HTML transcript writer
+
+The history is read oldest first, so every message can be rendered and written the
+moment it arrives instead of collecting the whole channel and reversing it. Writes go
+through a large file buffer, memory use stays flat however long the channel is.
+"""
+import os
+import re
+import shutil
+import time
+from logging import Logger, getLogger
+from typing import IO, Callable, NamedTuple, Optional
+
+import discord
+
+from ..config.transcript_config import createHeader
+
+transcript_logger: Logger = getLogger("Eternal.Transcripts")
+
+# Bytes collected before the file is written to
+WRITE_BUFFER = 1 << 20
+
+FOOTER = "</main></body></html>"
+
+MESSAGE_TEMPLATE = '''
+                    <div class="message">
+                        <img class="avatar" src="{pfp}" alt="{author_name} avatar">
+                        <div class="content">
+                            <div class="header">
+                                <span class="username" style="color:{color}">{author_name}</span>
+                            </div>
+                            <div class="message-body">{content}</div>
+                            {attachments}
+                        </div>
+                    </div>
+                    '''
+
+Render = Callable[[discord.Message], str]
+# Called with the number of messages written since the last call
+Progress = Callable[[int], None]
+
+_UNSAFE_FILENAME = re.compile(r"[^\w\-. ]+")
+
+
+def transcript_filename(channel: discord.abc.GuildChannel | discord.Thread) -> str:
+    # Names aren't unique and may contain path separators
+    return f"{_UNSAFE_FILENAME.sub('_', channel.name)}-{channel.id}.html"
+
+
+class TranscriptReport(NamedTuple):
+    name: str
+    path: str
+    messages: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.messages / max(self.seconds, 1e-9)
+
+    def describe(self) -> str:
+        return f"{self.name}: {self.messages} messages in {self.seconds:.1f} s ({self.rate:.0f} messages/s)"
+
+
+class TranscriptWriter:
+    """Writes one transcript file, a message at a time."""
+
+    def __init__(self, path: str, render: Render, buffer_size: int = WRITE_BUFFER):
+        self.path = path
+        self._render = render
+        self._file = open(path, "w", encoding="utf-8", buffering=buffer_size)
+        self.messages = 0
+
+    async def write_header(self, name: str, intro: Optional[str] = None):
+        self._file.write(await createHeader(name))
+        if intro:
+            self._file.write(intro)
+
+    def write_message(self, message: discord.Message):
+        self._file.write(self._render(message))
+        self.messages += 1
+
+    def write_fragments(self, fragments: IO[str], messages: int):
+        """Copies messages that were rendered earlier, see `transcripts.checkpoint`."""
+        shutil.copyfileobj(fragments, self._file, WRITE_BUFFER)
+        self.messages += messages
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write(FOOTER)
+            self._file.close()
+
+    def abort(self):
+        """Closes and removes the unfinished file."""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def write_transcript(
+    source: discord.abc.Messageable,
+    path: str,
+    name: str,
+    render: Render,
+    intro: Optional[str] = None,
+    progress: Optional[Progress] = None,
+) -> TranscriptReport:
+    """Streams the whole history of a channel or thread into an HTML transcript.
+
+    The file is removed again if the export fails or is cancelled.
+    """
+    start = time.perf_counter()
+    writer = TranscriptWriter(path, render)
+    try:
+        await writer.write_header(name, intro)
+        async for message in source.history(limit=None, oldest_first=True):
+            writer.write_message(message)
+            if progress is not None:
+                progress(1)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    report = TranscriptReport(name, path, writer.messages, time.perf_counter() - start)
+    transcript_logger.info("Transcript of %s", report.describe())
+    return report